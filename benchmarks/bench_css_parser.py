@@ -0,0 +1,110 @@
+"""大きなスタイルシートと style 属性の宣言を CSSParser でパースするスループットのベンチマーク。
+
+    python benchmarks/bench_css_parser.py [--sizes 1 4] [--legacy]
+
+--legacy を付けると、1 文字ずつ読み、例外で読み飛ばしていた以前の宣言のパーサーとも比較する。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from css_parser import CSSParser  # noqa: E402
+
+
+class LegacyCSSParser(CSSParser):
+    def body(self, in_rule=True):
+        pairs = {}
+        while self.i < len(self.s) and self.s[self.i] != "}":
+            try:
+                prop, val = self.pair()
+                pairs[prop.casefold()] = val
+                self.whitespace()
+                self.literal(";")
+                self.whitespace()
+            except Exception:
+                why = self.ignore_until([";", "}"])
+                if why == ";":
+                    self.literal(";")
+                    self.whitespace()
+                else:
+                    break
+        return pairs
+
+    def whitespace(self):
+        while self.i < len(self.s) and self.s[self.i].isspace():
+            self.i += 1
+
+    def word(self):
+        start = self.i
+        while self.i < len(self.s):
+            if self.s[self.i].isalnum() or self.s[self.i] in "#-.%":
+                self.i += 1
+            else:
+                break
+        if not (self.i > start):
+            raise Exception("Parsing error")
+        return self.s[start:self.i]
+
+    def ignore_until(self, chars):
+        while self.i < len(self.s):
+            if self.s[self.i] in chars:
+                return self.s[self.i]
+            else:
+                self.i += 1
+        return None
+
+
+RULE = """.card-{0} .title, #item-{0} {{
+    background-color: lightblue;
+    font-size: 14px;
+    margin: 0 auto;
+    color: rgb(10, 20, {1});
+    font-family: "Helvetica Neue", Arial, sans-serif;
+    bogus declaration;
+    padding-left: 4%;
+}}
+"""
+DECLARATIONS = "color: red; background-color: #eee; font-size: 12px; width: 50%; margin: 0 auto; "
+
+
+def make_stylesheet(size: int) -> str:
+    count = max(1, size // len(RULE.format(0, 0)))
+    return "".join(RULE.format(i, i % 256) for i in range(count))
+
+
+def best(function, repeat: int) -> float:
+    result = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        result = min(result, time.perf_counter() - start)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4], help="MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    parsers = [("regex", CSSParser)]
+    if args.legacy:
+        parsers.append(("per-char", LegacyCSSParser))
+
+    print("{:>10} {:>12} {:>8} {:>10} {:>10}".format("parser", "input", "MB", "seconds", "MB/s"))
+    for name, parser_class in parsers:
+        for size in args.sizes:
+            css = make_stylesheet(int(size * 1024 * 1024))
+            declarations = DECLARATIONS * max(1, int(size * 1024 * 1024) // len(DECLARATIONS))
+            for label, text, method in [("stylesheet", css, "parse"), ("declarations", declarations, "body")]:
+                mb = len(text) / 1024 / 1024
+                seconds = best(lambda: getattr(parser_class(text), method)(), args.repeat)
+                print("{:>10} {:>12} {:>8.2f} {:>10.3f} {:>10.1f}".format(name, label, mb, seconds, mb / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""DOM ツリーが 1 ノードあたりに使うメモリを、以前の __dict__ を持つノードと比べるベンチマーク。
+ArenaDOM に詰め替えた後のメモリと pickle したサイズも表示する。
+
+    python benchmarks/bench_dom_memory.py [--nodes 100000]
+"""
+import argparse
+import gc
+import os
+import pickle
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_parser  # noqa: E402
+from html_parser import HTMLParser  # noqa: E402
+from dom_arena import ArenaDOM  # noqa: E402
+
+
+class LegacyText:
+    def __init__(self, text, parent) -> None:
+        self.text = text
+        self.parent = parent
+        self.children = []
+
+
+class LegacyElement:
+    def __init__(self, tag, attribute, parent) -> None:
+        self.tag = tag
+        # 以前はタグごとに属性の辞書を作っていた
+        self.attribute = html_parser.parse_attributes(attribute)
+        self.style = {}
+        self.parent = parent
+        self.children = []
+
+
+def make_document(nodes: int) -> str:
+    """1 行あたり要素 3 つとテキスト 3 つの、およそ nodes ノードの文書"""
+    row = '<li class="item"><a href="/x">link</a> text <b>bold</b></li>\n'
+    return "<html><body><ul>\n" + row * max(1, nodes // 6) + "</ul></body></html>"
+
+
+def count_nodes(root) -> int:
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+def measure(body: str) -> tuple:
+    """ツリーを作ったまま確保されているメモリとノード数を返す"""
+    gc.collect()
+    tracemalloc.start()
+    root = HTMLParser(body).parse()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, count_nodes(root)
+
+
+def measure_arena(body: str) -> tuple:
+    """ArenaDOM だけを残したときに確保されているメモリと、pickle したサイズを返す"""
+    tree = HTMLParser(body).parse()
+    gc.collect()
+    tracemalloc.start()
+    dom = ArenaDOM.from_tree(tree)
+    del tree
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, len(pickle.dumps(dom))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100000)
+    args = parser.parse_args()
+    body = make_document(args.nodes)
+
+    # 以前のノードクラスと intern しないタグ名・属性名に差し替えて測る
+    slotted = (html_parser.Text, html_parser.Element, html_parser.intern)
+    html_parser.Text, html_parser.Element = LegacyText, LegacyElement
+    html_parser.intern = lambda s: s
+    try:
+        before, nodes = measure(body)
+    finally:
+        html_parser.Text, html_parser.Element, html_parser.intern = slotted
+    after, _ = measure(body)
+    arena, pickled = measure_arena(body)
+
+    print("{} nodes".format(nodes))
+    print("{:>8} {:>12} {:>14}".format("", "total MB", "bytes/node"))
+    for name, size in [("before", before), ("after", after), ("arena", arena)]:
+        print("{:>8} {:>12.1f} {:>14.1f}".format(name, size / 1024 / 1024, size / nodes))
+    print("reduction: {:.0%} (objects), {:.0%} (arena)".format(
+        1 - after / before, 1 - arena / before))
+    print("arena pickle: {:.1f} MB".format(pickled / 1024 / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""スナップショットからの読み込みと HTMLParser.parse の時間を比べるベンチマーク。
+
+    python benchmarks/bench_dom_snapshot.py [--sizes 1 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parser import HTMLParser  # noqa: E402
+from dom_snapshot import SnapshotCache  # noqa: E402
+
+
+def make_document(size: int) -> str:
+    """要素とテキストが細かく入り組んだ、およそ size バイトの文書"""
+    row = (
+        '<li class="item"><a href="/page/1" title="link">link</a> text '
+        '<b>bold</b> <span style="color:red">red</span></li>\n'
+    )
+    return "<html><body><ul>\n" + row * max(1, size // len(row)) + "</ul></body></html>"
+
+
+def best(function, repeat: int) -> float:
+    result = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        result = min(result, time.perf_counter() - start)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4], help="MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>8} {:>10} {:>10} {:>10} {:>8}".format("MB", "parse", "snapshot", "file MB", "speedup"))
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SnapshotCache(directory, max_size=1 << 34)
+        for size in args.sizes:
+            body = make_document(int(size * 1024 * 1024))
+            cache.store(body, HTMLParser(body).parse())
+            parse = best(lambda: HTMLParser(body).parse(), args.repeat)
+            snapshot = best(lambda: cache.lookup(body), args.repeat)
+            print("{:>8.2f} {:>10.3f} {:>10.3f} {:>10.2f} {:>7.1f}x".format(
+                len(body) / 1024 / 1024, parse, snapshot,
+                cache.size / 1024 / 1024, parse / snapshot,
+            ))
+            cache.clear()
+
+
+if __name__ == "__main__":
+    main()
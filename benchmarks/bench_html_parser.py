@@ -0,0 +1,82 @@
+"""HTMLParser.parse がボディの長さに対して線形に伸びることを確かめるベンチマーク。
+
+    python benchmarks/bench_html_parser.py [--sizes 1 2 4 8] [--legacy]
+
+--legacy を付けると、1 文字ずつテキストを連結していた以前の実装とも比較する。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parser import HTMLParser  # noqa: E402
+
+
+class LegacyHTMLParser(HTMLParser):
+    def parse(self):
+        text = ""
+        in_tag = False
+        for c in self.body:
+            if c == "<":
+                in_tag = True
+                text = text.replace("\n", "")
+                text = text.strip()
+                if text:
+                    self.add_text(text)
+                text = ""
+            elif c == ">":
+                in_tag = False
+                self.add_tag(tag=text)
+                text = ""
+            else:
+                text += c
+        if not in_tag and text:
+            self.add_text(text=text)
+        return self.close_unfinished_node()
+
+
+def make_document(size: int) -> str:
+    """長いテキストの段落と短いインライン要素を混ぜた、およそ size バイトの文書"""
+    paragraph = (
+        '<p class="text">' + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+        + "<b>bold</b> <i>italic</i><br></p>\n"
+    )
+    count = max(1, size // len(paragraph))
+    return "<html><body>\n" + paragraph * count + "</body></html>"
+
+
+def measure(parser_class, body: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser_class(body).parse()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 4, 8], help="MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    parsers = [("find/regex", HTMLParser)]
+    if args.legacy:
+        parsers.append(("per-char", LegacyHTMLParser))
+
+    print("{:>10} {:>8} {:>10} {:>10} {:>12}".format("parser", "MB", "seconds", "MB/s", "s per MB"))
+    for name, parser_class in parsers:
+        for size in args.sizes:
+            body = make_document(int(size * 1024 * 1024))
+            mb = len(body) / (1024 * 1024)
+            seconds = measure(parser_class, body, args.repeat)
+            print("{:>10} {:>8.2f} {:>10.3f} {:>10.1f} {:>12.4f}".format(
+                name, mb, seconds, mb / seconds, seconds / mb,
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""style() の時間がスタイルシートの全ルール数ではなく、要素に関係するルール数に比例することを確かめるベンチマーク。
+
+    python benchmarks/bench_style.py [--rules 100 1000 10000] [--nodes 20000]
+
+全てのルールを全ての要素と照合する線形探索とも比較する。
+同じ style 属性が繰り返される文書で、パース結果のキャッシュの有無も比べる。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parser import HTMLParser  # noqa: E402
+import css_parser  # noqa: E402
+from css_parser import CSSParser, StyleSheet, style, inline_style_stats  # noqa: E402
+
+
+class LinearStyleSheet(StyleSheet):
+    def candidates(self, node):
+        return [rule for bucket in self.buckets.values() for rule in bucket]
+
+
+def make_document(nodes: int) -> str:
+    row = '<li class="item c{0}"><a href="/x" class="link">link</a> <b id="b{0}">bold</b></li>\n'
+    rows = "".join(row.format(i % 50) for i in range(max(1, nodes // 5)))
+    return '<html><body><ul class="list">\n' + rows + "</ul></body></html>"
+
+
+def make_stylesheet(rules: int) -> str:
+    # 文書に関係するルールは一定数で、残りは一致しないクラスや id のルール
+    relevant = "li { color: black } .item { font-size: 12px } ul .link { color: blue } #b1 { color: red }\n"
+    return relevant + "".join(
+        ".unused{0} p {{ color: red }} #none{0} {{ color: blue }}\n".format(i)
+        for i in range(max(0, rules - 4) // 2)
+    )
+
+
+def make_inline_document(nodes: int, distinct: int) -> str:
+    # 行ごとに親が違うので、兄弟の共有ではなく style 属性のキャッシュが効く
+    row = '<tr><td style="color: #{0:03x}; background-color: white; font-size: 12px">{0}</td></tr>'
+    rows = "".join(row.format(i % distinct) for i in range(max(1, nodes // 3)))
+    return "<html><body><table>" + rows + "</table></body></html>"
+
+
+def uncached_inline_style(text):
+    return CSSParser(text).body()
+
+
+def best(function, repeat: int) -> float:
+    result = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        result = min(result, time.perf_counter() - start)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-linear", action="store_true", help="skip the linear scan")
+    args = parser.parse_args()
+
+    root = HTMLParser(make_document(args.nodes)).parse()
+    print("{:>8} {:>12} {:>12}".format("rules", "buckets s", "linear s"))
+    for count in args.rules:
+        css = make_stylesheet(count)
+        rules = StyleSheet()
+        rules.add_css(css)
+        bucketed = best(lambda: style(root, rules), args.repeat)
+        linear = float("nan")
+        if not args.no_linear and count <= 1000:
+            rules = LinearStyleSheet()
+            rules.add_css(css)
+            linear = best(lambda: style(root, rules), args.repeat)
+        print("{:>8} {:>12.3f} {:>12.3f}".format(len(rules), bucketed, linear))
+
+    resolver = style(root, rules)
+    distinct = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        distinct.add(id(node.style))
+        stack.extend(node.children)
+    print()
+    print("style sharing: {} computed, {} shared, {} distinct style objects".format(
+        resolver.computed, resolver.shared, len(distinct),
+    ))
+
+    root = HTMLParser(make_inline_document(args.nodes, distinct=30)).parse()
+    css_parser.parse_inline_style.cache_clear()
+    cached = best(lambda: style(root), args.repeat)
+    stats = inline_style_stats()
+    parse_inline_style = css_parser.parse_inline_style
+    css_parser.parse_inline_style = uncached_inline_style
+    try:
+        uncached = best(lambda: style(root), args.repeat)
+    finally:
+        css_parser.parse_inline_style = parse_inline_style
+    print()
+    print("inline styles (30 distinct strings): cached {:.3f}s, uncached {:.3f}s, hit rate {:.1%}".format(
+        cached, uncached, stats["hit_rate"],
+    ))
+
+
+if __name__ == "__main__":
+    main()
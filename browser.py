@@ -1,14 +1,43 @@
 from typing import Union, Optional, List, Tuple
+import os
 import tkinter
 
-from url import URL
+from url import URL, FETCH_ERRORS
+from http_cache import HTTPCache
 from html_parser import HTMLParser
-from css_parser import style
+from dom_snapshot import SnapshotCache
+from css_parser import StyleSheet, collect_stylesheets, style
 from layout import DocumentLayout, layout_tree
 
 # ウィンドウの縦横幅
 WIDTH, HEIGHT = 800, 600
 
+# HTTP キャッシュの保存先
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "pybrowser", "http")
+# パース済みの DOM のスナップショットの保存先
+SNAPSHOT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "pybrowser", "dom")
+
+
+def load_stylesheets(dom_node, base_url: str, cache: Optional[HTTPCache] = None) -> StyleSheet:
+    """文書のスタイルシートを集める。link の href は base_url を基準に解決して取得する
+
+    Args:
+        dom_node (Element): DOM ツリーの頂点
+        base_url (str): リダイレクトを辿った後の文書の URL
+        cache (Optional[HTTPCache], optional): HTTP キャッシュ。 Defaults to None.
+    """
+    base = URL(base_url)
+
+    def fetch(href: str) -> Optional[str]:
+        try:
+            headers, text = URL(base.resolve(href)).request(cache=cache)
+        except FETCH_ERRORS:
+            # 取得できないスタイルシートは無視してページを表示する
+            return None
+        return text
+
+    return collect_stylesheets(dom_node, fetch)
+
 
 class Browser:
     def __init__(self) -> None:
@@ -27,6 +56,11 @@ class Browser:
         self.window.bind("+", self.magnify)
         self.window.bind("-", self.reduce)
 
+        # 変更のないページはディスクから読み込む
+        self.http_cache = HTTPCache(CACHE_DIRECTORY)
+        # 内容が変わらないページはパースせずにスナップショットから読み込む
+        self.snapshot_cache = SnapshotCache(SNAPSHOT_DIRECTORY)
+
     # canvas に描画
     def draw(self):  # HACK description 追加
         self.canvas.delete("all")
@@ -82,9 +116,18 @@ class Browser:
             self.draw()
 
     def load(self, url: str):
-        headers, body = URL(url).request()
-        self.dom_node = HTMLParser(body).parse()
-        style(self.dom_node)
+        location = URL(url)
+        headers, chunks = location.stream(cache=self.http_cache)
+        body = "".join(chunks)
+        # スナップショットの鍵はボディ全体のハッシュなので、全て届いてから調べる
+        dom = self.snapshot_cache.lookup(body)
+        if dom is not None:
+            self.dom_node = dom.root
+        else:
+            self.dom_node = HTMLParser(body).parse()
+            self.snapshot_cache.store(body, self.dom_node)
+        rules = load_stylesheets(self.dom_node, location.final_url, self.http_cache)
+        style(self.dom_node, rules)
         self.document = DocumentLayout(dom_node=self.dom_node, width=WIDTH)
         self.document.layout()
         self.display_list = []
@@ -96,5 +139,10 @@ class Browser:
 if __name__ == "__main__":
     import sys
 
+    # --headless の場合はウィンドウを作らずにまとめてレンダリングする
+    if sys.argv[1:2] == ["--headless"]:
+        import headless
+        sys.exit(headless.main(sys.argv[2:]))
+
     Browser().load(sys.argv[1])
     tkinter.mainloop()
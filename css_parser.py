@@ -1,57 +1,404 @@
-from html_parser import Element
-
-def style(dom_node):
-        dom_node.style = {}
-        if isinstance(dom_node, Element) and "style" in dom_node.attribute:
-            pairs = CSSParser(dom_node.attribute["style"]).body()
-            for property, value in pairs.items():
-                dom_node.style[property] = value
-        
-        for child in dom_node.children:
-            style(child)
+from typing import Callable, Dict, List, Optional, Tuple
+from functools import lru_cache
+from types import MappingProxyType
+import re
+from html_parser import Element, Text
+
+# 複合セレクタの 1 要素。タグ名、#id、.class、*
+SIMPLE_SELECTOR = re.compile(r"([#.]?)([-\w]+)|\*")
+# 閉じていないコメントは入力の最後まで続く
+COMMENT = re.compile(r"/\*.*?(?:\*/|\Z)", re.DOTALL)
+
+# 親から子に引き継ぐプロパティと、文書の頂点での値
+INHERITED_PROPERTIES = {
+    "font-size": "16px",
+    "font-weight": "normal",
+    "font-style": "normal",
+    "color": "black",
+}
+
+# 宣言 1 つ分。値は引用符で囲んだ文字列、括弧 (rgb(...) など)、カンマや空白を含む複数のトークンを許す。
+# 末尾の !important などの優先度は値に含めない
+DECLARATION = re.compile(
+    r"""\s*(?P<property>[-\w]+)\s*:\s*"""
+    r"""(?P<value>(?:"[^"]*"|'[^']*'|\([^()]*\)|[^;}!"'()\s]|\s+(?=[^;}!\s]))+)"""
+    r"""(?:\s*!\s*[-\w]+)?\s*(?:;|(?=\})|\Z)"""
+)
+WHITESPACE = re.compile(r"\s*")
+WORD = re.compile(r"(?:[^\W_]|[#.%-])+")
+# ignore_until で探す文字の集合ごとの正規表現
+STOP_CHARACTERS: Dict[tuple, "re.Pattern"] = {}
+
+# パース済みの style 属性を覚えておく、異なる宣言の文字列の数
+INLINE_STYLE_CACHE_SIZE = 1024
+
+
+class CompoundSelector:
+    def __init__(self, text: str) -> None:
+        """div.note#main のような、空白を含まない複合セレクタ
+
+        Raises:
+            ValueError: 対応していないセレクタの場合
+        """
+        self.tag = None
+        self.id = None
+        self.classes = []
+        pos = 0
+        while pos < len(text):
+            match = SIMPLE_SELECTOR.match(text, pos)
+            if not match:
+                raise ValueError("Unsupported selector {}".format(text))
+            prefix, name = match.groups()
+            if name is None:
+                pass  # * は何にでも一致する
+            elif prefix == "#":
+                self.id = name
+            elif prefix == ".":
+                self.classes.append(name)
+            else:
+                self.tag = name.lower()
+            pos = match.end()
+        self.specificity = (
+            1 if self.id else 0, len(self.classes), 1 if self.tag else 0
+        )
+
+    def matches(self, node) -> bool:
+        if not isinstance(node, Element):
+            return False
+        if self.tag and node.tag != self.tag:
+            return False
+        attribute = node.attribute or {}
+        if self.id and attribute.get("id") != self.id:
+            return False
+        if self.classes:
+            classes = attribute.get("class", "").split()
+            return all(name in classes for name in self.classes)
+        return True
+
+
+class Selector:
+    def __init__(self, text: str) -> None:
+        """div p.note のように、複合セレクタを子孫結合子 (空白) でつないだセレクタ
+
+        Raises:
+            ValueError: 対応していないセレクタの場合
+        """
+        self.text = text
+        self.compounds = [CompoundSelector(part) for part in text.split()]
+        if not self.compounds:
+            raise ValueError("Empty selector")
+        self.specificity = tuple(
+            sum(compound.specificity[i] for compound in self.compounds) for i in range(3)
+        )
+
+    def key(self) -> Tuple[str, Optional[str]]:
+        """ルールを入れるバケット。右端の複合セレクタの id、クラス、タグの順に選ぶ"""
+        last = self.compounds[-1]
+        if last.id:
+            return "id", last.id
+        if last.classes:
+            return "class", last.classes[0]
+        if last.tag:
+            return "tag", last.tag
+        return "universal", None
+
+    def matches(self, node) -> bool:
+        if not self.compounds[-1].matches(node):
+            return False
+        # 残りの複合セレクタを右から順に、祖先の中から近い順に探す
+        ancestor = node.parent
+        for compound in reversed(self.compounds[:-1]):
+            while ancestor is not None and not compound.matches(ancestor):
+                ancestor = ancestor.parent
+            if ancestor is None:
+                return False
+            ancestor = ancestor.parent
+        return True
+
+
+class StyleSheet:
+    def __init__(self) -> None:
+        """スタイルシートのルールを、右端の id、クラス、タグごとのバケットに分けて持つ。
+        要素ごとに、その要素の id、クラス、タグのバケットのルールだけを照合する。
+        """
+        self.buckets: Dict[Tuple[str, Optional[str]], list] = {}
+        self.count = 0  # 追加したルールの数。同じ詳細度では後のルールが勝つ
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, selector: Selector, body: Dict[str, str]) -> None:
+        # 宣言は一致した要素の style として共有するので、読み取り専用にする
+        rule = (selector.specificity, self.count, selector, MappingProxyType(dict(body)))
+        self.buckets.setdefault(selector.key(), []).append(rule)
+        self.count += 1
+
+    def add_css(self, text: str) -> None:
+        for selector, body in CSSParser(text).parse():
+            self.add(selector, body)
+
+    def candidates(self, node: Element) -> list:
+        attribute = node.attribute or {}
+        keys = [("tag", node.tag), ("universal", None)]
+        if "id" in attribute:
+            keys.append(("id", attribute["id"]))
+        for name in set(attribute.get("class", "").split()):
+            keys.append(("class", name))
+        rules = []
+        for key in keys:
+            rules.extend(self.buckets.get(key, ()))
+        return rules
+
+    def match(self, node: Element) -> List[Dict[str, str]]:
+        """要素に一致するルールの宣言を、カスケードの順 (詳細度、出現順) に返す"""
+        rules = [rule for rule in self.candidates(node) if rule[2].matches(node)]
+        rules.sort(key=lambda rule: rule[:2])
+        return [rule[3] for rule in rules]
+
+
+def collect_stylesheets(
+    root: Element, fetch: Optional[Callable[[str], Optional[str]]] = None,
+) -> StyleSheet:
+    """文書の <style> と <link rel=stylesheet> を文書順に読み、1 つの StyleSheet にする
+
+    Args:
+        root (Element): DOM ツリーの頂点
+        fetch (Optional[Callable[[str], Optional[str]]], optional): link の href を受け取り、
+            CSS の文字列を返す関数。取得できなければ None を返す。None の場合 link は無視する。
+    """
+    rules = StyleSheet()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Element):
+            continue
+        if node.tag == "style":
+            rules.add_css("".join(child.text for child in node.children if isinstance(child, Text)))
+        elif node.tag == "link" and fetch is not None:
+            attribute = node.attribute or {}
+            if "stylesheet" in attribute.get("rel", "").lower().split() and attribute.get("href"):
+                text = fetch(attribute["href"])
+                if text:
+                    rules.add_css(text)
+        stack.extend(reversed(node.children))
+    return rules
+
+
+@lru_cache(maxsize=INLINE_STYLE_CACHE_SIZE)
+def parse_inline_style(text: str) -> MappingProxyType:
+    """style 属性の宣言をパースする。
+    生成されたページでは同じ宣言が何度も現れるので、同じ文字列には同じ読み取り専用の辞書を返し、
+    その宣言を使う全ての要素で共有する。
+
+    Args:
+        text (str): style 属性の値。例 'color: red; font-size: 12px'
+    """
+    return MappingProxyType(CSSParser(text).body())
+
+
+def inline_style_stats() -> Dict[str, float]:
+    info = parse_inline_style.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+        "entries": info.currsize,
+        "max_size": info.maxsize,
+    }
+
+
+def computed_font_size(value: str, parent: str) -> str:
+    """% と em の font-size を、親の px の値を基準に px にする"""
+    if not parent.endswith("px"):
+        return value
+    try:
+        if value.endswith("%"):
+            scale = float(value[:-1]) / 100
+        elif value.endswith("em"):
+            scale = float(value[:-2])
+        else:
+            return value
+        return "{:g}px".format(float(parent[:-2]) * scale)
+    except ValueError:
+        return value
+
+
+class StyleResolver:
+    def __init__(self, rules: Optional[StyleSheet] = None) -> None:
+        """親の計算済みスタイルと要素の宣言から、要素の計算済みスタイルを決める。
+
+        計算済みスタイルは読み取り専用の辞書で、同じ親を持ち、タグ、id、class、style 属性が
+        同じ兄弟要素は 1 つの辞書を共有する。共有できた要素はルールの照合もしない。
+
+        Args:
+            rules (Optional[StyleSheet], optional): スタイルシート。 Defaults to None.
+        """
+        self.rules = rules
+        self.root_style = MappingProxyType(dict(INHERITED_PROPERTIES))
+        # id(親のスタイル) -> (親のスタイル, 継承するプロパティだけの辞書)
+        self.inherited: Dict[int, tuple] = {}
+
+        # 統計情報
+        self.computed = 0  # 計算した要素の数
+        self.shared = 0  # 兄弟要素のスタイルを共有した要素の数
+
+    def inherit(self, parent_style) -> MappingProxyType:
+        """親のスタイルのうち、子に引き継ぐプロパティだけの辞書"""
+        entry = self.inherited.get(id(parent_style))
+        if entry is None:
+            inherited = MappingProxyType({
+                property: parent_style.get(property, value)
+                for property, value in INHERITED_PROPERTIES.items()
+            })
+            # 親のスタイルを持っておき、id が使い回されないようにする
+            entry = self.inherited[id(parent_style)] = (parent_style, inherited)
+        return entry[1]
+
+    def resolve(self, node: Element, parent_style, siblings: dict) -> MappingProxyType:
+        """
+        Args:
+            node (Element): スタイルを決める要素
+            parent_style (Mapping[str, str]): 親の計算済みスタイル
+            siblings (dict): 同じ親を持つ兄弟要素で共有するスタイルのキャッシュ
+        """
+        attribute = node.attribute or {}
+        # セレクタが参照するのはタグ、id、class と祖先だけなので、兄弟でこれらが同じなら結果も同じ
+        key = (node.tag, attribute.get("id"), attribute.get("class"), attribute.get("style"))
+        computed = siblings.get(key)
+        if computed is not None:
+            self.shared += 1
+            return computed
+
+        self.computed += 1
+        declarations = self.rules.match(node) if self.rules else []
+        # style 属性はスタイルシートより優先する
+        if "style" in attribute:
+            declarations.append(parse_inline_style(attribute["style"]))
+        inherited = self.inherit(parent_style)
+        if not declarations:
+            computed = inherited
+        else:
+            values = dict(inherited)
+            for body in declarations:
+                values.update(body)
+            if values["font-size"] != inherited["font-size"]:
+                values["font-size"] = computed_font_size(values["font-size"], inherited["font-size"])
+            computed = MappingProxyType(values)
+        siblings[key] = computed
+        return computed
+
+
+def style(dom_node, rules: Optional[StyleSheet] = None) -> StyleResolver:
+        """DOM ツリーの各ノードの style を、スタイルシートのルール、style 属性、親からの継承で決める
+
+        Args:
+            dom_node (Union[Text, Element]): DOM ツリーの頂点
+            rules (Optional[StyleSheet], optional): スタイルシート。 Defaults to None.
+
+        Returns:
+            StyleResolver: 共有の統計情報
+        """
+        resolver = StyleResolver(rules)
+        stack = [(dom_node, resolver.root_style, {})]
+        while stack:
+            dom_node, parent_style, siblings = stack.pop()
+            if not isinstance(dom_node, Element):
+                # テキストは親から継承するプロパティだけを持つ
+                dom_node.style = resolver.inherit(parent_style)
+                continue
+            dom_node.style = resolver.resolve(dom_node, parent_style, siblings)
+            children = {}
+            stack.extend((child, dom_node.style, children) for child in reversed(dom_node.children))
+        return resolver
 
 class CSSParser:
     def __init__(self, s):
-        self.s = s
+        # コメントはスタイルシートでも style 属性でも空白と同じに扱う
+        self.s = COMMENT.sub(" ", s)
         self.i = 0
     
-    def body(self):
-        pairs = {}
+    def parse(self) -> List[Tuple[Selector, Dict[str, str]]]:
+        """スタイルシートをパースし、(セレクタ, 宣言) のリストを返す。
+        カンマ区切りのセレクタはそれぞれ別のルールにする。
+        対応していないセレクタや @ 規則のブロックは読み飛ばす。
+        """
+        rules = []
+        self.whitespace()
         while self.i < len(self.s):
-            try:
-                prop, val = self.pair()
-                pairs[prop.casefold()] = val
+            if self.s[self.i] == "@":
+                self.skip_block()
                 self.whitespace()
-                self.literal(";")
+                continue
+            try:
+                selectors = self.selectors()
+                self.literal("{")
                 self.whitespace()
+                body = self.body(in_rule=True)
+                self.literal("}")
+                for selector in selectors:
+                    rules.append((selector, body))
             except Exception:
-                """
-                パースエラーを全て無視することでデバッグしづらくなるが、
-                このブラウザが対応していない CSS でも最低限ページを表示できる
-                """
-                why = self.ignore_until([";"])
-                if why == ";":
-                    self.literal(";")
-                    self.whitespace()
-                else:
-                    break
-                
-        return pairs
-    
-    def whitespace(self):
-        while self.i < len(self.s) and self.s[self.i].isspace():
-            self.i += 1
-    
-    def word(self):
+                self.skip_block()
+            self.whitespace()
+        return rules
+
+    def selectors(self) -> List[Selector]:
         start = self.i
+        self.ignore_until(["{", "}"])
+        return [Selector(text.strip()) for text in self.s[start:self.i].split(",")]
+
+    def skip_block(self):
+        """次の ; か、対応する } まで読み飛ばす"""
+        depth = 0
         while self.i < len(self.s):
-            if self.s[self.i].isalnum() or self.s[self.i] in "#-.%":
+            c = self.s[self.i]
+            self.i += 1
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+                if depth <= 0:
+                    return
+            elif c == ";" and depth == 0:
+                return
+
+    def body(self, in_rule: bool = False):
+        """宣言の並びを正規表現で 1 つずつ読み、プロパティと値の辞書を返す。
+
+        パースエラーを全て無視することでデバッグしづらくなるが、
+        このブラウザが対応していない CSS でも最低限ページを表示できる。
+        読めない宣言は次の ; まで読み飛ばす。
+
+        Args:
+            in_rule (bool, optional): スタイルシートのルールの中なら True。
+                ルールでは } で宣言が終わり、style 属性では } も読み飛ばす。 Defaults to False.
+        """
+        pairs = {}
+        s = self.s
+        stop = [";", "}"] if in_rule else [";"]
+        self.whitespace()
+        while self.i < len(s) and not (in_rule and s[self.i] == "}"):
+            match = DECLARATION.match(s, self.i)
+            if match:
+                pairs[match.group("property").casefold()] = match.group("value")
+                self.i = match.end()
+            elif self.ignore_until(stop) == ";":
                 self.i += 1
             else:
                 break
-        if not (self.i > start):
+            self.whitespace()
+        return pairs
+
+    def whitespace(self):
+        self.i = WHITESPACE.match(self.s, self.i).end()
+
+    def word(self):
+        match = WORD.match(self.s, self.i)
+        if not match:
             raise Exception("Parsing error")
-        return self.s[start:self.i]
+        self.i = match.end()
+        return match.group()
     
     def literal(self, literal):
         if not (self.i < len(self.s) and self.s[self.i] == literal):
@@ -67,9 +414,14 @@ class CSSParser:
         return prop.casefold(), val
     
     def ignore_until(self, chars):
-        while self.i < len(self.s):
-            if self.s[self.i] in chars:
-                return self.s[self.i]
-            else: 
-                self.i += 1
-        return None
+        pattern = STOP_CHARACTERS.get(tuple(chars))
+        if pattern is None:
+            pattern = STOP_CHARACTERS[tuple(chars)] = re.compile(
+                "[" + "".join(re.escape(c) for c in chars) + "]"
+            )
+        match = pattern.search(self.s, self.i)
+        if match is None:
+            self.i = len(self.s)
+            return None
+        self.i = match.start()
+        return self.s[self.i]
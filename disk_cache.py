@@ -0,0 +1,103 @@
+from typing import Dict, List
+from collections import OrderedDict
+import os
+
+
+class DiskLRUCache:
+    def __init__(self, directory: str, max_size: int, extensions: List[str]) -> None:
+        """キーごとのファイルをディレクトリに保存し、合計サイズの上限を超えたら LRU で追い出す。
+        HTTPCache と SnapshotCache が共有する。
+
+        1 つのエントリは拡張子だけが違う 1 つ以上のファイルからなる。先頭の拡張子のファイルの
+        サイズを合計サイズに数え、その更新時刻を最終アクセス時刻として使う。
+
+        Args:
+            directory (str): ファイルを保存するディレクトリ
+            max_size (int): 先頭の拡張子のファイルの合計サイズの上限 (バイト)
+            extensions (List[str]): 1 エントリのファイルの拡張子。書き込む順に並べる
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.extensions = extensions
+        os.makedirs(directory, exist_ok=True)
+
+        # key -> ファイルサイズ。先頭が最も古くアクセスされたエントリ
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self.load_index()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size": self.size,
+        }
+
+    def path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, key + ext)
+
+    def load_index(self) -> None:
+        """ディレクトリを走査して、アクセス時刻順のインデックスを作り直す。
+        ファイルが揃っていないエントリは書き込み途中だったものとして無視する
+        """
+        primary = self.extensions[0]
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(primary):
+                continue
+            key = name[:-len(primary)]
+            if not all(os.path.exists(self.path(key, ext)) for ext in self.extensions[1:]):
+                continue
+            stat = os.stat(self.path(key, primary))
+            found.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+
+    def write(self, key: str, files: Dict[str, bytes]) -> None:
+        """エントリのファイルを書き込み、上限を超えていれば古いエントリを追い出す
+
+        Args:
+            key (str): エントリのキー
+            files (Dict[str, bytes]): 拡張子ごとのファイルの中身
+        """
+        self.remove(key)
+        for ext in self.extensions:
+            # 書き込み途中のファイルを読まないよう、一時ファイルに書いてから置き換える
+            path = self.path(key, ext)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as file:
+                file.write(files[ext])
+            os.replace(tmp, path)
+        size = len(files[self.extensions[0]])
+        self.entries[key] = size
+        self.size += size
+        self.evict()
+
+    def touch(self, key: str) -> None:
+        self.entries.move_to_end(key)
+        try:
+            os.utime(self.path(key, self.extensions[0]))
+        except OSError:
+            pass
+
+    def remove(self, key: str) -> None:
+        if key in self.entries:
+            self.size -= self.entries.pop(key)
+        # 書き込みと逆順に消し、途中で止まっても揃っていないエントリとして無視されるようにする
+        for ext in reversed(self.extensions):
+            try:
+                os.remove(self.path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def evict(self) -> None:
+        """サイズの上限を超えている間、最も古くアクセスされたエントリから削除する"""
+        while self.size > self.max_size and self.entries:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        for key in list(self.entries):
+            self.remove(key)
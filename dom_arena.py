@@ -0,0 +1,277 @@
+from typing import Dict, List, Optional, Union
+from array import array
+from sys import intern
+
+from html_parser import Text, Element, EMPTY_STYLE, SELF_CLOSING_TAGS, Tokenizer, parse_attributes
+
+# テキストノードのタグ ID
+TEXT = -1
+# 親や兄弟がいないことを表すノード ID
+NONE = -1
+
+
+def format_attributes(attribute: Optional[dict]) -> str:
+    """パース済みの属性の辞書を、parse_attributes で元に戻せる文字列にする"""
+    parts = []
+    for key, value in (attribute or {}).items():
+        value = value.replace("&", "&amp;").replace('"', "&quot;")
+        parts.append(key + '="' + value + '"')
+    return " ".join(parts)
+
+
+class ArenaDOM:
+    def __init__(self) -> None:
+        """DOM ツリーをノードごとのオブジェクトではなく、整数 ID で引く並列配列で持つ。
+
+        ノード i のタグ、親、最初の子、次の兄弟は配列の i 番目に入り、テキストと
+        パース前の属性の文字列は 1 つの共有バッファへのオフセットで表す。
+        Python オブジェクトはノード数によらず一定個なので、大きな文書でもメモリが少なく、
+        そのまま pickle してプロセス間で渡せる。
+        style や BlockLayout からは node が返す ElementView / TextView を通して使う。
+        """
+        self.tags: List[str] = []  # タグ ID -> タグ名
+        self.tag_ids: Dict[str, int] = {}  # タグ名 -> タグ ID
+        self.tag = array("i")  # ノード -> タグ ID。テキストノードは TEXT
+        self.parent = array("i")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.next_sibling = array("i")
+        # テキストノードはテキスト、要素はパース前の属性の文字列の buffer 内の範囲
+        self.start = array("q")
+        self.end = array("q")
+        self.buffer = ""
+        self.parts: List[str] = []  # 構築中の buffer の断片
+        self.size = 0  # 構築中の buffer の長さ
+        self.init_views()
+
+    def init_views(self) -> None:
+        # レイアウト中に作られるビューと、ビューに書き込まれた値。pickle はしない
+        self.views: Dict[int, Union["ElementView", "TextView"]] = {}
+        self.children: Dict[int, list] = {}
+        self.styles: Dict[int, dict] = {}
+        self.attributes: Dict[int, dict] = {}
+
+    def __getstate__(self) -> dict:
+        self.finish()
+        state = dict(self.__dict__)
+        for name in ["views", "children", "styles", "attributes"]:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.init_views()
+
+    def __len__(self) -> int:
+        return len(self.tag)
+
+    def add(self, tag_id: int, parent: int, data: str) -> int:
+        """ノードを末尾に追加し、親の最後の子としてつなぐ
+
+        Args:
+            tag_id (int): タグ ID。テキストノードは TEXT
+            parent (int): 親のノード ID。頂点は NONE
+            data (str): テキストノードはテキスト、要素はパース前の属性の文字列
+
+        Returns:
+            int: 追加したノードの ID
+        """
+        index = len(self.tag)
+        self.tag.append(tag_id)
+        self.parent.append(parent)
+        self.first_child.append(NONE)
+        self.last_child.append(NONE)
+        self.next_sibling.append(NONE)
+        self.start.append(self.size)
+        self.parts.append(data)
+        self.size += len(data)
+        self.end.append(self.size)
+        if parent != NONE:
+            last = self.last_child[parent]
+            if last == NONE:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last] = index
+            self.last_child[parent] = index
+        return index
+
+    def add_element(self, tag: str, attribute: Union[str, dict, None], parent: int) -> int:
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self.tag_ids[tag] = len(self.tags)
+            self.tags.append(intern(tag))
+        if not isinstance(attribute, str):
+            attribute = format_attributes(attribute)
+        return self.add(tag_id, parent, attribute)
+
+    def add_text(self, text: str, parent: int) -> int:
+        return self.add(TEXT, parent, text)
+
+    def finish(self) -> None:
+        """構築中のテキストの断片を 1 つの buffer にまとめる"""
+        if self.parts:
+            self.buffer += "".join(self.parts)
+            self.parts = []
+
+    @classmethod
+    def from_tree(cls, root: Element) -> "ArenaDOM":
+        """HTMLParser が作ったツリーを先行順に並べて ArenaDOM にする"""
+        dom = cls()
+        stack = [(root, NONE)]
+        while stack:
+            node, parent = stack.pop()
+            if isinstance(node, Element):
+                # まだ読まれていない属性はパースせずに文字列のまま移す
+                index = dom.add_element(node.tag, node._attribute, parent)
+                for child in reversed(node.children):
+                    stack.append((child, index))
+            else:
+                dom.add_text(node.text, parent)
+        dom.finish()
+        return dom
+
+    def to_tree(self) -> Element:
+        """ノードごとのオブジェクトを持つ通常の DOM ツリーに戻す"""
+        nodes = []
+        for index in range(len(self)):
+            parent = nodes[self.parent[index]] if self.parent[index] != NONE else None
+            if self.tag[index] == TEXT:
+                node = Text(self.text(index), parent)
+            else:
+                node = Element(self.tags[self.tag[index]], self.text(index), parent)
+            if parent is not None:
+                parent.children.append(node)
+            nodes.append(node)
+        return nodes[0]
+
+    @property
+    def root(self) -> "ElementView":
+        return self.node(0)
+
+    def node(self, index: int) -> Union["ElementView", "TextView"]:
+        """ノード ID のビューを返す。同じ ID には同じビューを返す"""
+        view = self.views.get(index)
+        if view is None:
+            if self.tag[index] == TEXT:
+                view = TextView(self, index)
+            else:
+                view = ElementView(self, index)
+            self.views[index] = view
+        return view
+
+    def text(self, index: int) -> str:
+        self.finish()
+        return self.buffer[self.start[index]:self.end[index]]
+
+    def attribute(self, index: int) -> dict:
+        attribute = self.attributes.get(index)
+        if attribute is None:
+            attribute = self.attributes[index] = parse_attributes(self.text(index))
+        return attribute
+
+    def child_ids(self, index: int) -> List[int]:
+        ids = []
+        child = self.first_child[index]
+        while child != NONE:
+            ids.append(child)
+            child = self.next_sibling[child]
+        return ids
+
+
+class ArenaBuilder(Tokenizer):
+    def __init__(self) -> None:
+        """Tokenizer のイベントから、ノードのオブジェクトを作らずに直接 ArenaDOM を作る。
+        ツリーの組み立て方は HTMLParser と同じ。
+        """
+        super().__init__()
+        self.dom = ArenaDOM()
+        self.unfinished: List[int] = []
+
+    def parse(self, body: str) -> ArenaDOM:
+        self.feed(body)
+        return self.close()
+
+    def close(self) -> ArenaDOM:
+        super().close()
+        if not self.unfinished:
+            self.handle_start_tag("html", "")
+        self.unfinished = []
+        self.dom.finish()
+        return self.dom
+
+    def handle_text(self, text: str) -> None:
+        self.dom.add_text(text, self.unfinished[-1])
+
+    def handle_start_tag(self, tag: str, attribute: str) -> None:
+        parent = self.unfinished[-1] if self.unfinished else NONE
+        index = self.dom.add_element(tag, attribute, parent)
+        if tag not in SELF_CLOSING_TAGS:
+            self.unfinished.append(index)
+
+    def handle_end_tag(self, tag: str) -> None:
+        if len(self.unfinished) > 1:
+            self.unfinished.pop()
+
+
+class ElementView(Element):
+    # Element のスロットをプロパティで置き換え、値は ArenaDOM から読む
+    __slots__ = ("dom", "index")
+
+    def __init__(self, dom: ArenaDOM, index: int) -> None:
+        self.dom = dom
+        self.index = index
+
+    @property
+    def tag(self) -> str:
+        return self.dom.tags[self.dom.tag[self.index]]
+
+    @property
+    def attribute(self) -> dict:
+        return self.dom.attribute(self.index)
+
+    @property
+    def parent(self) -> Optional["ElementView"]:
+        parent = self.dom.parent[self.index]
+        return self.dom.node(parent) if parent != NONE else None
+
+    @property
+    def children(self) -> list:
+        # レイアウトが子を書き換える (li の箇条書き記号) ので、作ったリストを保持する
+        children = self.dom.children.get(self.index)
+        if children is None:
+            children = [self.dom.node(i) for i in self.dom.child_ids(self.index)]
+            self.dom.children[self.index] = children
+        return children
+
+    @property
+    def style(self) -> dict:
+        return self.dom.styles.get(self.index, EMPTY_STYLE)
+
+    @style.setter
+    def style(self, value: dict) -> None:
+        self.dom.styles[self.index] = value
+
+
+class TextView(Text):
+    __slots__ = ("dom", "index")
+
+    def __init__(self, dom: ArenaDOM, index: int) -> None:
+        self.dom = dom
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return self.dom.text(self.index)
+
+    @property
+    def parent(self) -> Optional[ElementView]:
+        parent = self.dom.parent[self.index]
+        return self.dom.node(parent) if parent != NONE else None
+
+    @property
+    def style(self) -> dict:
+        return self.dom.styles.get(self.index, EMPTY_STYLE)
+
+    @style.setter
+    def style(self, value: dict) -> None:
+        self.dom.styles[self.index] = value
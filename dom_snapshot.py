@@ -0,0 +1,151 @@
+from typing import Dict, Optional
+from array import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from sys import intern
+
+from html_parser import Element
+from dom_arena import ArenaDOM
+from disk_cache import DiskLRUCache
+
+MAGIC = b"PBDOM\x00\x00\x00"
+# パーサーの出力が変わったら上げる。古いスナップショットは読まれなくなる
+VERSION = 3
+
+# マジック、バージョン、ノード数、タグ名表のバイト数、テキストのバイト数
+HEADER = struct.Struct("<8sIIQQ")
+# ノードごとの int32 の列。ArenaDOM の属性名
+INT_COLUMNS = ["tag", "parent", "first_child", "last_child", "next_sibling"]
+
+
+def little_endian(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def dumps(dom: ArenaDOM) -> bytes:
+    """ArenaDOM をバイナリのスナップショットにする。
+
+    ヘッダーの後にノードごとの整数の列、タグ名表、全てのテキストを 1 つにつないだ
+    UTF-8 のバッファが続く。整数はリトルエンディアンで書く。
+    """
+    dom.finish()
+    tags = "\0".join(dom.tags).encode("utf8")
+    buffer = dom.buffer.encode("utf8")
+    parts = [HEADER.pack(MAGIC, VERSION, len(dom), len(tags), len(buffer))]
+    for name in INT_COLUMNS:
+        parts.append(little_endian(getattr(dom, name)))
+    # end[i] は start[i + 1] と同じなので start だけ書く
+    parts.append(little_endian(dom.start))
+    parts.append(tags)
+    parts.append(buffer)
+    return b"".join(parts)
+
+
+def loads(data) -> ArenaDOM:
+    """スナップショットから ArenaDOM を作る。パースはせず、配列をそのままコピーする
+
+    Args:
+        data (bytes-like): dumps が作ったバイト列。mmap も渡せる
+
+    Raises:
+        ValueError: スナップショットでない、またはバージョンが違う場合
+    """
+    with memoryview(data) as view:
+        if len(view) < HEADER.size:
+            raise ValueError("truncated DOM snapshot")
+        magic, version, count, tags_size, buffer_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a DOM snapshot of version {}".format(VERSION))
+        size = HEADER.size + count * (4 * len(INT_COLUMNS) + 8) + tags_size + buffer_size
+        if len(view) != size:
+            raise ValueError("truncated DOM snapshot")
+
+        dom = ArenaDOM()
+        offset = HEADER.size
+        for name, typecode in [(name, "i") for name in INT_COLUMNS] + [("start", "q")]:
+            column = array(typecode)
+            end = offset + count * column.itemsize
+            column.frombytes(view[offset:end])
+            if sys.byteorder == "big":
+                column.byteswap()
+            setattr(dom, name, column)
+            offset = end
+        tags = str(view[offset:offset + tags_size], "utf8")
+        offset += tags_size
+        dom.buffer = str(view[offset:offset + buffer_size], "utf8")
+
+    dom.tags = [intern(tag) for tag in tags.split("\0")] if count else []
+    dom.tag_ids = {tag: i for i, tag in enumerate(dom.tags)}
+    dom.size = len(dom.buffer)
+    dom.end = dom.start[1:]
+    if count:
+        dom.end.append(dom.size)
+    return dom
+
+
+def load(path: str) -> ArenaDOM:
+    """スナップショットのファイルを mmap して読み込む"""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise ValueError("truncated DOM snapshot")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return loads(data)
+
+
+class SnapshotCache(DiskLRUCache):
+    def __init__(self, directory: str, max_size: int = 64 * 1024 * 1024) -> None:
+        """レスポンスのボディのハッシュをキーに、パース済みの DOM を保存するディスクキャッシュ。
+
+        内容が変わらないページは、パースせずにスナップショットを読み込むだけで済む。
+        ファイルの更新時刻を最終アクセス時刻として LRU で追い出す。
+
+        Args:
+            directory (str): スナップショットを保存するディレクトリ
+            max_size (int, optional): スナップショットの合計サイズの上限 (バイト)。 Defaults to 64MiB.
+        """
+        super().__init__(directory, max_size, [".dom"])
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        stats = super().stats()
+        stats.update({
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        })
+        return stats
+
+    def key(self, body: str) -> str:
+        digest = hashlib.sha256(body.encode("utf8"))
+        digest.update(str(VERSION).encode())
+        return digest.hexdigest()
+
+    def lookup(self, body: str) -> Optional[ArenaDOM]:
+        key = self.key(body)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            dom = load(self.path(key, ".dom"))
+        except (OSError, ValueError):
+            self.remove(key)
+            self.misses += 1
+            return None
+        self.touch(key)
+        self.hits += 1
+        return dom
+
+    def store(self, body: str, root: Element) -> None:
+        """パースしたツリーをスナップショットにして保存する"""
+        data = dumps(ArenaDOM.from_tree(root))
+        if len(data) > self.max_size:
+            return
+        self.write(self.key(body), {".dom": data})
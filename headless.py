@@ -0,0 +1,204 @@
+from typing import List, Optional, Tuple
+import argparse
+import concurrent.futures
+import math
+import os
+import sys
+import time
+import unicodedata
+
+from url import URL
+from html_parser import HTMLParser
+from css_parser import style
+from browser import load_stylesheets
+from layout import DocumentLayout, BlockLayout, DrawText, DrawRect, layout_tree
+
+# browser.py のウィンドウと同じ横幅
+WIDTH = 800
+
+
+class HeadlessFont:
+    def __init__(
+        self, family: Optional[str] = None, size: int = 16,
+        weight: str = "normal", slant: str = "roman",
+    ) -> None:
+        """ディスプレイのない環境で tkinter.font.Font の代わりに使うフォント。
+        文字幅と高さをフォントサイズから近似し、measure と metrics に同じ形で答える。
+
+        Args:
+            family (Optional[str], optional): フォント名。計測には使わない。 Defaults to None.
+            size (int, optional): フォントサイズ。 Defaults to 16.
+            weight (str, optional): "normal" または "bold"。 Defaults to "normal".
+            slant (str, optional): "roman" または "italic"。 Defaults to "roman".
+        """
+        self.options = {
+            "family": str(family),
+            "size": size,
+            "weight": weight,
+            "slant": slant,
+            "underline": 0,
+            "overstrike": 0,
+        }
+        # 半角文字の幅。太字は少し広くする
+        self.char_width = size * (0.6 if weight == "bold" else 0.55)
+        ascent = math.ceil(size * 0.9)
+        descent = math.ceil(size * 0.25)
+        self._metrics = {
+            "ascent": ascent,
+            "descent": descent,
+            "linespace": ascent + descent,
+            "fixed": 0,
+        }
+
+    def __getitem__(self, option: str):
+        return self.options[option]
+
+    def configure(self) -> dict:
+        return dict(self.options)
+
+    def measure(self, text: str) -> int:
+        # 全角文字は半角文字の 2 倍の幅とする
+        width = 0.0
+        for c in text:
+            if unicodedata.east_asian_width(c) in "WF":
+                width += 2 * self.char_width
+            else:
+                width += self.char_width
+        return round(width)
+
+    def metrics(self, *options: str):
+        if options:
+            return self._metrics[options[0]]
+        return dict(self._metrics)
+
+
+def render(url: str, width: int = WIDTH) -> Tuple[DocumentLayout, list]:
+    """取得、パース、スタイル、レイアウトを行い、レイアウトツリーと display_list を返す"""
+    location = URL(url)
+    headers, chunks = location.stream()
+    parser = HTMLParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    dom_node = parser.close()
+    style(dom_node, load_stylesheets(dom_node, location.final_url))
+    document = DocumentLayout(dom_node=dom_node, width=width, font_factory=HeadlessFont)
+    document.layout()
+    display_list = []
+    layout_tree(document, display_list)
+    return document, display_list
+
+
+def dump_display_list(display_list: list) -> str:
+    """display_list を 1 行 1 命令のタブ区切りテキストにする"""
+    lines = []
+    for cmd in display_list:
+        if isinstance(cmd, DrawText):
+            lines.append("text\t{}\t{}\t{}\t{}\t{}\t{}".format(
+                cmd.left, cmd.top, cmd.text,
+                cmd.font["size"], cmd.font["weight"], cmd.font["slant"],
+            ))
+        elif isinstance(cmd, DrawRect):
+            lines.append("rect\t{}\t{}\t{}\t{}\t{}".format(
+                cmd.left, cmd.top, cmd.right, cmd.bottom, cmd.color,
+            ))
+    return "\n".join(lines) + "\n"
+
+
+def dump_layout(document: DocumentLayout) -> str:
+    """レイアウトツリーを深さに応じて字下げしたテキストにする"""
+    lines = []
+    stack = [(document, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if isinstance(node, BlockLayout):
+            name = getattr(node.dom_node, "tag", None) or repr(node.dom_node)
+        else:
+            name = "document"
+        lines.append("{}{} x={} y={} width={} height={}".format(
+            "  " * depth, name, node.x, node.y, node.width, node.height,
+        ))
+        for child in reversed(node.children):
+            stack.append((child, depth + 1))
+    return "\n".join(lines) + "\n"
+
+
+def output_path(output: str, index: int, url: str) -> str:
+    name = url.rstrip("/").rsplit("/", 1)[-1] or "index"
+    name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)[:64]
+    return os.path.join(output, "{:05d}-{}.txt".format(index, name))
+
+
+def render_to_file(job: Tuple[int, str, str, str, int]) -> Tuple[str, Optional[str], float]:
+    """プロセスプールのワーカーで 1 文書を処理し、結果をファイルに書き出す
+
+    Returns:
+        Tuple[str, Optional[str], float]: URL、エラーメッセージ (成功時は None)、処理時間
+    """
+    index, url, output, dump, width = job
+    start = time.perf_counter()
+    try:
+        document, display_list = render(url, width)
+        if dump == "layout":
+            text = dump_layout(document)
+        else:
+            text = dump_display_list(display_list)
+        with open(output_path(output, index, url), "w", encoding="utf8") as file:
+            file.write(text)
+    except Exception as e:
+        return url, "{}: {}".format(type(e).__name__, e), time.perf_counter() - start
+    return url, None, time.perf_counter() - start
+
+
+def to_url(target: str) -> str:
+    """URL でなければローカルファイルのパスとみなして file:// URL にする"""
+    if "://" in target or target.startswith("data:"):
+        return target
+    return "file://" + os.path.abspath(target)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Render documents without a display and report throughput."
+    )
+    parser.add_argument("targets", nargs="*", help="URLs or file paths")
+    parser.add_argument("-i", "--input", help="file listing one URL or path per line")
+    parser.add_argument("-o", "--output", default="headless_output", help="directory for dumps")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--dump", choices=["display", "layout"], default="display")
+    parser.add_argument("--width", type=int, default=WIDTH)
+    args = parser.parse_args(argv)
+
+    targets = list(args.targets)
+    if args.input:
+        with open(args.input, encoding="utf8") as file:
+            targets.extend(line.strip() for line in file if line.strip())
+    if not targets:
+        parser.error("no documents given")
+    os.makedirs(args.output, exist_ok=True)
+
+    jobs = [
+        (i, to_url(target), args.output, args.dump, args.width)
+        for i, target in enumerate(targets)
+    ]
+    failures = 0
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        # 小さい文書が多い場合のプロセス間通信を減らすため、まとめて渡す
+        chunksize = max(1, len(jobs) // (4 * (args.jobs or 1)))
+        for url, error, elapsed in executor.map(render_to_file, jobs, chunksize=chunksize):
+            if error:
+                failures += 1
+                print("FAILED {}: {}".format(url, error), file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    print(
+        "{} documents ({} failed) in {:.2f}s: {:.1f} documents/s with {} workers".format(
+            len(jobs), failures, elapsed, len(jobs) / elapsed, args.jobs,
+        ),
+        file=sys.stderr,
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,123 +1,490 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional, Iterable, Iterator
+from sys import intern
+from types import MappingProxyType
+from html.entities import html5
+import re
+
+# タグの開始と終了の区切り文字
+TAG_DELIMITER = re.compile("[<>]")
+# タグの中身。= に続く引用符で囲まれた属性値は < と > を含んでいてもまとめて読む
+TAG_CONTENT = re.compile(r"""(?:[^<>=]++|=\s*+(?:"[^"]*+"|'[^']*+')|=(?!\s*+["']))*+""")
+
+# 中身をタグとして読まない要素の終わり。閉じタグ自体は通常のタグとして読む
+RAW_TEXT_END = {
+    "script": re.compile(r"</script[\s/>]", re.IGNORECASE),
+    "style": re.compile(r"</style[\s/>]", re.IGNORECASE),
+}
+COMMENT_START = "<!--"
+COMMENT_END = re.compile("-->")
+# 終わりの印がチャンクの境界で切れている場合に備えて、次の feed に持ち越す文字数
+RAW_TEXT_CARRY = 8
+
+# 属性 1 つ分。値は二重引用符、一重引用符、引用符なしのいずれか
+ATTRIBUTE = re.compile(r"""([^\s=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|(\S*)))?""")
+
+# 属性の文字列に id か class が含まれるか。含まれない要素は索引のために属性をパースしない
+ID_OR_CLASS = re.compile(r"(?i)(?:^|\s)(?:id|class)(?:\s|=|$)")
+
+# 文字参照。数値参照と一部の名前参照は末尾の ; を省略できる
+CHARACTER_REFERENCE = re.compile(
+    r"&(?:#[xX]([0-9a-fA-F]+);?|#([0-9]+);?|([A-Za-z][A-Za-z0-9]*;?))"
+)
+# ; なしで書ける古い名前参照。最も長いものから前方一致させる
+LEGACY_ENTITIES = sorted((name for name in html5 if not name.endswith(";")), key=len, reverse=True)
+# 0x80 から 0x9F の数値参照は Windows-1252 の文字として読む
+WINDOWS_1252 = {}
+for code in range(0x80, 0xA0):
+    try:
+        WINDOWS_1252[code] = bytes([code]).decode("cp1252")
+    except UnicodeDecodeError:
+        pass
+
+
+def decode_reference(match: re.Match) -> str:
+    hex, decimal, name = match.groups()
+    if name is None:
+        code = int(hex, 16) if hex is not None else int(decimal)
+        if code in WINDOWS_1252:
+            return WINDOWS_1252[code]
+        if code == 0 or code > 0x10FFFF or 0xD800 <= code <= 0xDFFF:
+            return "\ufffd"
+        return chr(code)
+    if name in html5:
+        return html5[name]
+    if not name.endswith(";"):
+        # &copy2023 のように後ろに英数字が続く古い名前参照
+        for legacy in LEGACY_ENTITIES:
+            if name.startswith(legacy):
+                return html5[legacy] + name[len(legacy):]
+    # 知らない名前参照はそのまま残す
+    return match.group(0)
+
+
+def decode_attribute_reference(match: re.Match) -> str:
+    # 属性値では ; のない名前参照の後ろに英数字か = が続く場合は参照として読まない。
+    # href="?a=1&region=us" の &reg が ® にならないようにする
+    name = match.group(3)
+    if name is not None and not name.endswith(";"):
+        # 正規表現は英数字を最長一致するので、html5 にない名前は後ろに英数字が続く前方一致か未知の名前
+        if name not in html5 or match.string.startswith("=", match.end()):
+            return match.group(0)
+    return decode_reference(match)
+
+
+def unescape(text: str, in_attribute: bool = False) -> str:
+    """テキストの名前文字参照と数値文字参照を文字に置き換える
+
+    Args:
+        text (str): テキストまたは属性値
+        in_attribute (bool, optional): 属性値なら True。 Defaults to False.
+    """
+    # 大半のテキストには & がないので、何もせずに返す
+    if "&" not in text:
+        return text
+    return CHARACTER_REFERENCE.sub(
+        decode_attribute_reference if in_attribute else decode_reference, text
+    )
+
+
+# スタイル未設定のノードが共有する空のスタイル。書き換えるときは新しい辞書を代入する
+EMPTY_STYLE = MappingProxyType({})
 
 
 class Text:
+    # ノードごとの __dict__ を持たせず、大きな文書でのメモリを抑える
+    __slots__ = ("text", "parent", "style")
+
+    # テキストノードは子を持たないので、全てのノードで同じ空のタプルを共有する
+    children = ()
+
     def __init__(self, text, parent) -> None:
         self.text = text
         self.parent = parent
-        self.children = []
 
     def __repr__(self) -> str:
         return repr(self.text)
 
 
+def parse_attributes(text: str) -> Dict[str, str]:
+    """タグ名より後ろの属性の文字列をパースする。
+    引用符で囲まれた値は空白や = を含んでいてもそのまま 1 つの値とする。
+
+    Args:
+        text (str): 属性の文字列。例 'class="a b" hidden'
+    """
+    attribute = {}
+    for match in ATTRIBUTE.finditer(text):
+        key, double, single, bare = match.groups()
+        if double is not None:
+            value = unescape(double, True)
+        elif single is not None:
+            value = unescape(single, True)
+        else:
+            # 属性に=属性値が指定されていない場合、デフォルト値は空の文字列
+            value = unescape(bare or "", True)
+        # 属性名は種類が少ないので intern して全てのノードで共有する
+        attribute[intern(key.lower())] = value
+    return attribute
+
+
 class Element:
+    __slots__ = ("tag", "_attribute", "style", "parent", "children")
+
     def __init__(self, tag, attribute, parent) -> None:
+        """
+        Args:
+            tag (str): タグ名
+            attribute (Union[str, Dict[str, str], None]): 属性の辞書。
+                パース前の属性の文字列を渡すと、最初に attribute を読んだときにパースする。
+            parent (Optional[Element]): 親ノード
+        """
         self.tag = tag
-        self.attribute = attribute
-        self.style = {}
+        self._attribute = attribute
+        self.style = EMPTY_STYLE
         self.parent = parent
         self.children = []
 
+    @property
+    def attribute(self) -> Optional[Dict[str, str]]:
+        if isinstance(self._attribute, str):
+            self._attribute = parse_attributes(self._attribute)
+        return self._attribute
+
+    @attribute.setter
+    def attribute(self, value) -> None:
+        self._attribute = value
+
     def __repr__(self) -> str:
         return "<" + self.tag + ">"
 
 
-class HTMLParser:
-    def __init__(self, body) -> None:
-        self.body = body
-        self.unfinished = []
-        self.SELF_CLOSING_TAGS = [
-            "area",
-            "base",
-            "br",
-            "col",
-            "embed",
-            "hr",
-            "img",
-            "input",
-            "link",
-            "meta",
-            "param",
-            "source",
-            "track",
-            "wbr",
-        ]
+SELF_CLOSING_TAGS = [
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+]
 
-    def parse(self) -> List[Element]:
-        text = ""
-        in_tag = False
-        for c in self.body:
-            if c == "<":
-                in_tag = True
+# イベントの種類
+START_TAG = "start_tag"
+END_TAG = "end_tag"
+TEXT = "text"
+
+
+class Tokenizer:
+    def __init__(self) -> None:
+        """HTML のボディをタグの開始、タグの終了、テキストのイベントに分ける。
+
+        feed で届いたチャンクを読み、handle_start_tag、handle_end_tag、handle_text を
+        文書順に呼ぶ。ツリーは作らないので、テキストやリンクを取り出すだけならサブクラスで
+        これらを上書きすれば、文書の大きさによらず一定のメモリで処理できる。
+        """
+        # feed の間で持ち越す、区切り文字がまだ来ていないテキストの断片
+        self.pending = []
+        self.in_tag = False
+        # 次のチャンクの先頭につなげて読み直す、チャンク末尾の数文字
+        self.carry = ""
+        # script、style の中身かコメントを読んでいる間は、その終わりを探す正規表現
+        self.raw_end = None
+
+    def handle_start_tag(self, tag: str, attribute: str) -> None:
+        """開始タグ。attribute はパース前の属性の文字列で、parse_attributes で辞書にできる"""
+
+    def handle_end_tag(self, tag: str) -> None:
+        """終了タグ"""
+
+    def handle_text(self, text: str) -> None:
+        """文字参照を置き換えたテキスト。script と style の中身は書かれたまま"""
+
+    def feed(self, chunk: str) -> None:
+        """届いたチャンクを読み、イベントを出せるところまで出す。
+
+        < と > の位置へ正規表現で飛び、間のテキストをスライスで切り出す。
+        1 文字ずつ文字列を連結しないので、長いテキストでもボディの長さに比例する時間で終わる。
+        最後の区切り文字より後ろは、チャンクの境界でタグやテキストが切れていても
+        正しく扱えるよう次の feed まで持ち越す。
+
+        Args:
+            chunk (str): ボディの一部
+        """
+        if self.carry:
+            chunk = self.carry + chunk
+            self.carry = ""
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self.raw_end is not None:
+                # script、style の中身やコメントの中の < と > はタグとして読まず、終わりまで飛ぶ
+                match = self.raw_end.search(chunk, pos)
+                if match is None:
+                    keep = max(pos, end - RAW_TEXT_CARRY)
+                    self.pending.append(chunk[pos:keep])
+                    self.carry = chunk[keep:]
+                    return
+                self.pending.append(chunk[pos:match.start()])
+                text = "".join(self.pending)
+                self.pending = []
+                if self.raw_end is COMMENT_END:
+                    # コメントは捨てる
+                    pos = match.end()
+                else:
+                    self.add_raw_text(text)
+                    pos = match.start()
+                self.raw_end = None
+                continue
+
+            if self.in_tag:
+                start = self.find_tag_end(chunk, pos)
+                if start == -1:
+                    # 引用符の中がチャンクの境界で切れていても読めるよう、タグを < から持ち越す
+                    self.carry = "<" + chunk[pos:]
+                    self.in_tag = False
+                    return
+            else:
+                match = TAG_DELIMITER.search(chunk, pos)
+                if match is None:
+                    self.pending.append(chunk[pos:])
+                    return
+                start = match.start()
+            text = chunk[pos:start]
+            if self.pending:
+                self.pending.append(text)
+                text = "".join(self.pending)
+                self.pending = []
+            if chunk[start] == "<":
+                self.in_tag = True
                 text = text.replace("\n", "")  # 改行コードは飛ばす
                 text = text.strip()  # 空白のみのテキストを除去
                 if text:
                     self.add_text(text)
-                text = ""
-            elif c == ">":
-                in_tag = False
+                head = chunk[start:start + len(COMMENT_START)]
+                if head == COMMENT_START:
+                    self.in_tag = False
+                    self.raw_end = COMMENT_END
+                    pos = start + len(COMMENT_START)
+                    continue
+                if len(head) < len(COMMENT_START) and COMMENT_START.startswith(head):
+                    # コメントの始まりかどうか、次のチャンクまで分からない
+                    self.carry = chunk[start:]
+                    return
+            else:
+                self.in_tag = False
                 self.add_tag(tag=text)
-                text = ""
+            pos = start + 1
+
+    def find_tag_end(self, chunk: str, pos: int) -> int:
+        """タグの中の次の < か > の位置を返す。引用符で囲まれた属性値の中は飛ばす
+
+        Returns:
+            int: 区切り文字の位置。チャンク内にない場合は -1
+        """
+        end = TAG_CONTENT.match(chunk, pos).end()
+        # チャンクの終わりか、閉じていない引用符の手前で止まった
+        if end == len(chunk) or chunk[end] == "=":
+            return -1
+        return end
+
+    def close(self) -> None:
+        """持ち越したテキストを処理し、残りのイベントを出す"""
+        if self.carry:
+            if self.raw_end is None:
+                # 閉じていない < から後ろは捨てる
+                self.in_tag = True
             else:
-                text += c
-        if not in_tag and text:
+                self.pending.append(self.carry)
+            self.carry = ""
+        text = "".join(self.pending)
+        self.pending = []
+        if self.raw_end is not None:
+            # 閉じていない script や style の中身は最後まで、コメントは捨てる
+            if self.raw_end is not COMMENT_END:
+                self.add_raw_text(text)
+            self.raw_end = None
+        elif not self.in_tag and text:
             self.add_text(text=text)
-        return self.close_unfinished_node()
 
     def add_text(self, text: str):
-        # 最初のノードはエッジケース
-        parent = self.unfinished[-1] if self.unfinished else None
-        node = Text(text, parent)
-        parent.children.append(node)
+        self.handle_text(unescape(text))
+
+    def add_raw_text(self, text: str):
+        # script や style の中身は文字参照を含め、書かれたまま 1 つのテキストにする
+        if text.strip():
+            self.handle_text(text)
 
     def add_tag(self, tag: str):
-        tag, attribute = self.get_attribute(tag)
+        # 属性は読まれるまでパースしない
+        tag, attribute = self.split_tag(tag)
 
-        # doctype や　コメントアウトは無視する
+        # doctype は無視する
         if tag.startswith("!"):
             return
-        elif tag in self.SELF_CLOSING_TAGS:  # 自己閉鎖タグ
+        elif tag.startswith("/"):
+            self.handle_end_tag(tag[1:])
+        else:
+            self.raw_end = RAW_TEXT_END.get(tag)
+            self.handle_start_tag(tag, attribute)
+
+    def split_tag(self, text: str) -> Tuple[str, str]:
+        """< と > の中身をタグ名とパース前の属性の文字列に分ける
+
+        Args:
+            text (str): < と > の中身の文字列
+        """
+        parts = text.split(None, 1)
+        tag = parts[0].lower() if parts else ""
+        tag = intern(tag.rstrip("/"))  # 末尾にくっつく形で / がある場合、削除する。
+        # タグ名は種類が少ないので intern して全てのノードで共有する
+        return tag, parts[1] if len(parts) > 1 else ""
+
+    def get_attribute(self, text: str) -> Tuple[str, Dict[str, str]]:
+        """タグ要素の属性と属性値をパース
+        Args:
+            text (str): < と > の中身の文字列
+        """
+        tag, attribute = self.split_tag(text)
+        return tag, parse_attributes(attribute)
+
+
+class EventCollector(Tokenizer):
+    # iter_events のためにイベントをタプルで溜める
+    def __init__(self) -> None:
+        super().__init__()
+        self.events = []
+
+    def handle_start_tag(self, tag: str, attribute: str) -> None:
+        self.events.append((START_TAG, tag, attribute))
+
+    def handle_end_tag(self, tag: str) -> None:
+        self.events.append((END_TAG, tag))
+
+    def handle_text(self, text: str) -> None:
+        self.events.append((TEXT, text))
+
+
+def iter_events(chunks: Iterable[str]) -> Iterator[tuple]:
+    """チャンクを順に読み、イベントを 1 つずつ返す。
+
+    溜めておくのは 1 チャンク分のイベントだけなので、ツリーを作らずに大きな文書を処理できる。
+
+    Args:
+        chunks (Iterable[str]): ボディのチャンク。str を 1 つ渡すと 1 文字ずつになるので注意
+
+    Yields:
+        tuple: (START_TAG, タグ名, 属性の文字列)、(END_TAG, タグ名)、(TEXT, テキスト) のいずれか
+    """
+    tokenizer = EventCollector()
+    for chunk in chunks:
+        tokenizer.feed(chunk)
+        yield from tokenizer.events
+        tokenizer.events.clear()
+    tokenizer.close()
+    yield from tokenizer.events
+
+
+class HTMLParser(Tokenizer):
+    def __init__(self, body: Optional[str] = None) -> None:
+        """HTML のボディから DOM ツリーを作る。Tokenizer のイベントからツリーを組み立てる。
+
+        ボディ全体があれば parse で、届いた分ずつであれば feed と close でツリーを作る。
+        作りかけのツリーは root から辿れる。
+
+        Args:
+            body (Optional[str], optional): parse でパースするボディ。 Defaults to None.
+        """
+        super().__init__()
+        self.body = body
+        self.unfinished = []
+        self.SELF_CLOSING_TAGS = SELF_CLOSING_TAGS
+
+        # 要素の索引。値のリストは文書順に並ぶ
+        self.id_index: Dict[str, Element] = {}
+        self.tag_index: Dict[str, List[Element]] = {}
+        self.class_index: Dict[str, List[Element]] = {}
+
+    def parse(self) -> List[Element]:
+        """ボディ全体をパースしてツリーの頂点を返す"""
+        self.feed(self.body)
+        return self.close()
+
+    def close(self) -> Element:
+        """持ち越したテキストを処理し、完成したツリーの頂点を返す"""
+        super().close()
+        return self.close_unfinished_node()
+
+    @property
+    def root(self) -> Optional[Element]:
+        """作りかけのツリーの頂点。まだノードがなければ None"""
+        return self.unfinished[0] if self.unfinished else None
+
+    def handle_text(self, text: str):
+        # 最初のノードはエッジケース
+        parent = self.unfinished[-1] if self.unfinished else None
+        node = Text(text, parent)
+        parent.children.append(node)
+
+    def handle_start_tag(self, tag: str, attribute: str):
+        if tag in self.SELF_CLOSING_TAGS:  # 自己閉鎖タグ
             parent = self.unfinished[-1] if self.unfinished else None
             node = Element(tag, attribute, parent)
             parent.children.append(node)
-        elif tag.startswith("/"):
-            # 最後のノードもエッジケースとして処理
-            if len(self.unfinished) == 1:
-                return
-            # タグを閉じてノード完成
-            node = self.unfinished.pop()
-            parent = self.unfinished[-1]
-            parent.children.append(node)
+            self.add_index(node, attribute)
         else:
             # 新規タグノードを作成し、未完ノードリストに追加する
+            # 作りかけのツリーを辿れるよう、開いた時点で親ノードに追加する
             # 最初のノードはエッジケース
             parent = self.unfinished[-1] if self.unfinished else None
             node = Element(tag, attribute, parent)
+            if parent:
+                parent.children.append(node)
             self.unfinished.append(node)
+            self.add_index(node, attribute)
 
-    def get_attribute(self, text: str) -> Tuple[str, Dict[str, str]]:
-        """タグ要素の属性と属性値をパース
-        Args:
-            text (str): < と > の中身の文字列
-        """
-        parts = text.split()
-        tag = parts[0].lower()
-        tag = tag.rstrip("/")  # 末尾にくっつく形で / がある場合、削除する。
-        attribute = {}
-        for _attribute in parts[1:]:
-            if "=" in _attribute:
-                key, value = _attribute.split("=", 1)
-                # value に引用符が付いている場合、引用符をストリップする
-                if len(value) > 2 and value[0] in ["'", '"']:
-                    value = value[1:-1]
-                attribute[key.lower()] = value
-            else:
-                # 属性に=属性値が指定されていない場合、デフォルト値を設定
-                # デフォルト値は空の文字列
-                attribute[_attribute.lower()] = ""
+    def handle_end_tag(self, tag: str):
+        # 最後のノードもエッジケースとして処理
+        if len(self.unfinished) == 1:
+            return
+        # タグを閉じてノード完成
+        self.unfinished.pop()
 
-        return tag, attribute
+    def add_index(self, node: Element, attribute: str):
+        """作った要素を id、タグ名、クラス名の索引に登録する"""
+        self.tag_index.setdefault(node.tag, []).append(node)
+        if not ID_OR_CLASS.search(attribute):
+            return
+        # id が重複している場合は最初の要素を返す
+        id = node.attribute.get("id")
+        if id and id not in self.id_index:
+            self.id_index[id] = node
+        for name in set(node.attribute.get("class", "").split()):
+            self.class_index.setdefault(name, []).append(node)
+
+    def get_element_by_id(self, id: str) -> Optional[Element]:
+        return self.id_index.get(id)
+
+    def get_elements_by_tag_name(self, tag: str) -> List[Element]:
+        return list(self.tag_index.get(tag.lower(), []))
+
+    def get_elements_by_class_name(self, names: str) -> List[Element]:
+        """空白区切りのクラス名を全て持つ要素を文書順に返す"""
+        names = names.split()
+        if not names:
+            return []
+        # 最も少ない要素を持つクラスの候補だけを調べる
+        buckets = sorted((self.class_index.get(name, []) for name in names), key=len)
+        return [
+            node for node in buckets[0]
+            if all(name in node.attribute["class"].split() for name in names)
+        ]
 
     def close_unfinished_node(self) -> Element:
         """
@@ -126,8 +493,6 @@ class HTMLParser:
         """
         if len(self.unfinished) == 0:
             self.add_tag("html")
-        while len(self.unfinished) > 1:
-            node = self.unfinished.pop()
-            parent = self.unfinished[-1]
-            parent.children.append(node)
-        return self.unfinished.pop()
+        root = self.unfinished[0]
+        self.unfinished = []
+        return root
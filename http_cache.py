@@ -0,0 +1,197 @@
+from typing import Dict, Optional, Tuple
+from email.utils import parsedate_to_datetime
+import hashlib
+import json
+import time
+
+from disk_cache import DiskLRUCache
+
+# キャッシュに保存しないヘッダー。ボディは展開済みで保存するため、符号化と長さは意味を持たない
+UNCACHED_HEADERS = ["content-encoding", "transfer-encoding", "content-length", "connection"]
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """Cache-Control ヘッダーをディレクティブの辞書にパースする。
+
+    Args:
+        value (str): Cache-Control ヘッダーの値。例 'public, max-age=60'
+    """
+    directives = {}
+    for directive in value.split(","):
+        directive = directive.strip()
+        if not directive:
+            continue
+        if "=" in directive:
+            name, arg = directive.split("=", 1)
+            directives[name.strip().lower()] = arg.strip().strip('"')
+        else:
+            directives[directive.lower()] = None
+    return directives
+
+
+def parse_http_date(value: Optional[str]) -> Optional[float]:
+    """HTTP の日付文字列を UNIX 時間に変換する。不正な日付は None"""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheEntry:
+    def __init__(self, url: str, headers: dict, body: bytes, response_time: float) -> None:
+        """キャッシュされた 1 つのレスポンス。
+
+        Args:
+            url (str): リクエストした URL
+            headers (dict): レスポンスヘッダー。キーは小文字
+            body (bytes): 展開済みのボディ
+            response_time (float): レスポンスを受け取った UNIX 時間
+        """
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.response_time = response_time
+
+    def freshness_lifetime(self) -> float:
+        """レスポンスが新鮮である秒数。Cache-Control、Expires、Last-Modified の順に判断する"""
+        directives = parse_cache_control(self.headers.get("cache-control", ""))
+        if "no-cache" in directives:
+            return 0
+        if "max-age" in directives:
+            try:
+                return int(directives["max-age"])
+            except (TypeError, ValueError):
+                return 0
+
+        date = parse_http_date(self.headers.get("date")) or self.response_time
+        expires = parse_http_date(self.headers.get("expires"))
+        if "expires" in self.headers:
+            # 不正な Expires は既に期限切れとみなす
+            return expires - date if expires else 0
+
+        # ヒューリスティック: 最終更新からの経過時間の 10%
+        last_modified = parse_http_date(self.headers.get("last-modified"))
+        if last_modified:
+            return max(date - last_modified, 0) / 10
+        return 0
+
+    def age(self, now: float) -> float:
+        try:
+            age = int(self.headers.get("age", 0))
+        except ValueError:
+            age = 0
+        return age + max(now - self.response_time, 0)
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return self.age(now) < self.freshness_lifetime()
+
+    def validators(self) -> Dict[str, str]:
+        """再検証のための条件付きリクエストヘッダー"""
+        headers = {}
+        if "etag" in self.headers:
+            headers["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+
+class HTTPCache(DiskLRUCache):
+    def __init__(self, directory: str, max_size: int = 64 * 1024 * 1024) -> None:
+        """URL.request の背後で使うディスク上の HTTP キャッシュ。
+
+        エントリはメタデータ (.json) とボディ (.body) の 2 ファイルで保存し、
+        ボディファイルの更新時刻を最終アクセス時刻として LRU で追い出す。
+
+        Args:
+            directory (str): キャッシュを保存するディレクトリ
+            max_size (int, optional): ボディの合計サイズの上限 (バイト)。 Defaults to 64MiB.
+        """
+        # メタデータを最後に書き、ボディだけのエントリを読まないようにする
+        super().__init__(directory, max_size, [".body", ".json"])
+
+        # 統計情報
+        self.hits = 0  # 新鮮なエントリをそのまま返した回数
+        self.revalidated = 0  # 304 を受けてエントリを返した回数
+        self.misses = 0  # ボディ全体を取得した回数
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.revalidated + self.misses
+        stats = super().stats()
+        stats.update({
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.revalidated) / lookups if lookups else 0.0,
+        })
+        return stats
+
+    def key(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf8")).hexdigest()
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        key = self.key(url)
+        if key not in self.entries:
+            return None
+        try:
+            with open(self.path(key, ".json"), encoding="utf8") as file:
+                meta = json.load(file)
+            with open(self.path(key, ".body"), "rb") as file:
+                body = file.read()
+        except (OSError, ValueError):
+            self.remove(key)
+            return None
+        if meta["url"] != url:
+            return None
+        self.touch(key)
+        return CacheEntry(url, meta["headers"], body, meta["response_time"])
+
+    def lookup_fresh(self, url: str, now: Optional[float] = None) -> Tuple[Optional[CacheEntry], bool]:
+        """エントリを引き、新鮮かどうかも返す。新鮮なエントリはそのまま使えるのでヒットとして数える
+
+        Returns:
+            Tuple[Optional[CacheEntry], bool]: エントリ (なければ None) と新鮮かどうか
+        """
+        entry = self.lookup(url)
+        fresh = entry is not None and entry.is_fresh(now)
+        if fresh:
+            self.hits += 1
+        return entry, fresh
+
+    def store(self, url: str, headers: dict, body: bytes,
+              response_time: Optional[float] = None) -> bool:
+        """ボディ全体を取得したレスポンスを、キャッシュ可能であれば保存する。
+        保存したかどうかによらずミスとして数える
+
+        Returns:
+            bool: 保存したかどうか
+        """
+        self.misses += 1
+        return self.save(url, headers, body, response_time)
+
+    def save(self, url: str, headers: dict, body: bytes,
+             response_time: Optional[float] = None) -> bool:
+        directives = parse_cache_control(headers.get("cache-control", ""))
+        if "no-store" in directives or headers.get("vary", "").strip() == "*":
+            return False
+        if len(body) > self.max_size:
+            return False
+
+        headers = {k: v for k, v in headers.items() if k not in UNCACHED_HEADERS}
+        meta = {
+            "url": url,
+            "headers": headers,
+            "response_time": time.time() if response_time is None else response_time,
+        }
+        self.write(self.key(url), {".body": body, ".json": json.dumps(meta).encode("utf8")})
+        return True
+
+    def update(self, entry: CacheEntry, headers: dict) -> CacheEntry:
+        """304 レスポンスのヘッダーでエントリを更新し、新鮮さを回復させる"""
+        self.revalidated += 1
+        merged = dict(entry.headers)
+        merged.update({k: v for k, v in headers.items() if k not in UNCACHED_HEADERS})
+        self.save(entry.url, merged, entry.body)
+        return CacheEntry(entry.url, merged, entry.body, time.time())
@@ -1,21 +1,36 @@
 from __future__ import annotations
-from typing import Union, Optional, List, Tuple
+from typing import Union, Optional, List, Tuple, Callable
+import re
 import tkinter
 import tkinter.font
 from tkinter.font import Font
 from html_parser import Text, Element
 
+# CSS の rgb() と rgba()。tkinter は #rrggbb しか受け付けない
+RGB = re.compile(r"rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*(?:,[^)]*)?\)")
+
+
+def tk_color(value: str) -> str:
+    """CSS の色を tkinter で使える形にする"""
+    match = RGB.fullmatch(value.strip())
+    if match:
+        return "#{:02x}{:02x}{:02x}".format(*(min(int(c), 255) for c in match.groups()))
+    return value
+
+
 def layout_tree(layout_object: Union[DocumentLayout, BlockLayout], display_list: list):
-    """レイアウトツリーを再帰的に処理し display_layout へ一次元配列として掃き出す。
+    """レイアウトツリーを行きがけ順に処理し display_layout へ一次元配列として掃き出す。
+    深い入れ子でも再帰の上限に達しないよう、明示的なスタックで辿る。
 
     Args:
         layout_object (Union[DocumentLayout, BlockLayout]): レイアウトツリーのノード
         display_list (list): Browser.draw で使用される一次元配列
     """
-    display_list.extend(layout_object.paint())
-
-    for child in layout_object.children:
-        layout_tree(child, display_list)
+    stack = [layout_object]
+    while stack:
+        layout_object = stack.pop()
+        display_list.extend(layout_object.paint())
+        stack.extend(reversed(layout_object.children))
 
 # BlockLayout の親ノードとしての DocumentLayout
 class DocumentLayout:
@@ -27,10 +42,14 @@ class DocumentLayout:
         font_size: int = 16,
         maximum_font_size: int = 32,
         minimum_font_size: int = 4,
+        font_factory: Optional[Callable[..., Font]] = None,
     ) -> None:
         # DOM ツリーのノード
         self.dom_node = dom_node
 
+        # フォントを作る関数。ディスプレイのない環境では tkinter.font.Font の代わりを渡す
+        self.font_factory = font_factory or tkinter.font.Font
+
         # レイアウトツリーの子ノード
         self.children = []
 
@@ -63,7 +82,7 @@ class DocumentLayout:
         """ 
         DOM ツリーの各ノードの画面に対する表示位置を決定するレイアウトツリーを作成。
         DocumentLayout をルートノード、BlockLayout をその子ノードとして
-        DOM ツリーに対応する各要素の位置情報を持ったツリー構造を再帰的に作成する。
+        DOM ツリーに対応する各要素の位置情報を持ったツリー構造を作成する。
         """
         child = BlockLayout(
             dom_node=self.dom_node,
@@ -71,6 +90,7 @@ class DocumentLayout:
             previous=None,
             width=self.width,
             font_size=self.font_size,
+            font_factory=self.font_factory,
         )
         self.children.append(child)
         child.layout()
@@ -97,6 +117,7 @@ class BlockLayout(DocumentLayout):
         width: int = 800,
         font_family: Optional[str] = None,
         font_size: int = 16,
+        font_factory: Optional[Callable[..., Font]] = None,
     ) -> None:
         """ 
         DOM ツリーのノードをパースし、レイアウト情報を持つ各ブロックノード (BlockLayout) の
@@ -114,12 +135,14 @@ class BlockLayout(DocumentLayout):
             width (int, optional): ブロックノードの横幅。 Defaults to 800.
             font_family (Optional[str], None): フォント名。 Defaults to None.
             font_size (int, optional): フォントサイズ。 Defaults to 16.
+            font_factory (Optional[Callable[..., Font]], optional): フォントを作る関数。 Defaults to tkinter.font.Font.
         """
         super().__init__(
             dom_node=dom_node,
             width=width,
             font_family=font_family,
             font_size=font_size,
+            font_factory=font_factory,
         )
 
         # ブロックレイアウトツリー
@@ -159,7 +182,7 @@ class BlockLayout(DocumentLayout):
                 cmds.append(rect)
                 
             # スタイルシートで背景色指定があれば反映
-            bgcolor = self.dom_node.style.get("background-color", "transparent")
+            bgcolor = tk_color(self.dom_node.style.get("background-color", "transparent"))
             if bgcolor != "transparent":
                 x2, y2 = self.x + self.width, self.y + self.height
                 rect = DrawRect(x1=self.x, y1=self.y, x2=x2, y2=y2, color=bgcolor)
@@ -172,7 +195,30 @@ class BlockLayout(DocumentLayout):
 
     def layout(self):
         """
-        入力の DOM ツリーを再帰的にパースし、レイアウト情報を持つ各ブロック (BlockLayout) の重ね合わせであるレイアウトツリーとして再構築。
+        入力の DOM ツリーをパースし、レイアウト情報を持つ各ブロック (BlockLayout) の重ね合わせであるレイアウトツリーとして再構築。
+        子ブロックを順にレイアウトし、帰りがけに自ブロックの高さを計算する。
+        """
+        stack = [(self, None)]
+        while stack:
+            block, mode = stack.pop()
+            if mode is None:
+                # 行きがけ: 位置を決めて子ブロックを作り、子ブロックの後に高さを計算する
+                mode = block.layout_node()
+                stack.append((block, mode))
+                stack.extend((child, None) for child in reversed(block.children))
+            elif mode == "block":
+                # 自ブロックの高さを子ブロックの高さの合計として計算
+                block.height = sum(
+                    [child.height for child in block.children]
+                )
+
+    def layout_node(self) -> str:
+        """
+        自ブロックの位置を決め、block モードであれば子ブロックを作り、inline モードであれば
+        テキストの位置を決める。子ブロックのレイアウトは layout が行う。
+
+        Returns:
+            str: layout mode "block" または、"inline"
         """
         self.width = self.parent.width  # 親ブロックノードと自ブロックノードの width は同じ
         self.x = self.parent.x  # 親ブロックノードの左端から自ブロックノードの x 開始
@@ -186,7 +232,7 @@ class BlockLayout(DocumentLayout):
 
         mode = self.layout_mode()
         if mode == "block":
-            # block モードの場合、DOM ツリーの構造に対応するレイアウトツリーを再帰的に構築
+            # block モードの場合、DOM ツリーの構造に対応するレイアウトツリーを構築
             previous = None
             text_like_nodes = []
             for child in self.dom_node.children:
@@ -208,6 +254,7 @@ class BlockLayout(DocumentLayout):
                             previous=previous, 
                             width=self.width,
                             font_size=self.font_size,
+                            font_factory=self.font_factory,
                         )
                         self.children.append(next)
                         previous = next
@@ -219,12 +266,13 @@ class BlockLayout(DocumentLayout):
                         previous=previous, 
                         width=self.width,
                         font_size=self.font_size,
+                        font_factory=self.font_factory,
                     )
                     self.children.append(next)
                     previous = next
 
         else:
-            # inline モードの場合、DOM ノードの内容を再帰的に display_list に掃き出す
+            # inline モードの場合、DOM ノードの内容を display_list に掃き出す
             self.cursor_x = 0
             self.cursor_y = 0
             self.weight = "normal"
@@ -232,20 +280,13 @@ class BlockLayout(DocumentLayout):
             self.size = 16
 
             self.line = []  # 文字位置修正のためのバッファ
-            self.recurse(self.dom_node)  # 再帰的に DOM Tree をパース
+            self.recurse(self.dom_node)  # DOM Tree をパース
             self.set_position()  # 残りの全ての self.line の単語を display_list に掃き出す
 
             self.height = self.cursor_y
 
-        for child in self.children:
-            child.layout()
-        
-        # 自ブロックの高さを子ブロックの高さの合計として計算
-        if mode == "block":
-            self.height = sum(
-                [child.height for child in self.children]
-            )
-        
+        return mode
+
     def layout_mode(self):
         """ DOM ノードのタグに応じて、テキスト様の要素の場合は inline、それ以外を block モードと判別する
         モードに応じて、layout メソッド内でレイアウトツリーノードの作成かテキストの位置決めの場合分け処理を実行
@@ -267,22 +308,24 @@ class BlockLayout(DocumentLayout):
             return "block"
 
     def recurse(self, dom_node: Union[Text, Element]):
-        """ DOM ツリーの子ノードを再帰的にループし文字位置を計算。
+        """ DOM ツリーの子ノードを順にループし文字位置を計算。
 
         Args:
             dom_node (Union[Text, Element]): DOM ツリーのノード
         """
-        if isinstance(dom_node, Text):
-            self.set_text(dom_node)
-        else:
-            # タグオープン
-            self.open_tag(dom_node)
-
-            for child in dom_node.children:
-                self.recurse(child)
-
-            # タグクローズ
-            self.close_tag(dom_node)
+        stack = [(dom_node, False)]
+        while stack:
+            dom_node, closing = stack.pop()
+            if closing:
+                # タグクローズ
+                self.close_tag(dom_node)
+            elif isinstance(dom_node, Text):
+                self.set_text(dom_node)
+            else:
+                # タグオープン。open_tag が子ノードを追加することがあるので、その後で積む
+                self.open_tag(dom_node)
+                stack.append((dom_node, True))
+                stack.extend((child, False) for child in reversed(dom_node.children))
 
     def set_text(self, text_node: Text):
         font = self.get_font(
@@ -306,7 +349,7 @@ class BlockLayout(DocumentLayout):
         """フォントをキャッシュすることで高速化"""
         key = (font_family, font_size, font_weight, font_style)
         if key not in self.font_cache:
-            font = tkinter.font.Font(
+            font = self.font_factory(
                 family=font_family, size=font_size, weight=font_weight, slant=font_style
             )
             self.font_cache[key] = font
@@ -2,35 +2,23 @@ import unittest
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 import threading
 import time
+import os
 from browser import Browser
 from html_parser import Element, Text, HTMLParser
 from url import URL
 
 
-class TestBrowser(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls):
-        # サーバーを立ち上げる
-        cls.server = HTTPServer(("localhost", 8000), SimpleHTTPRequestHandler)
-        cls.server_thread = threading.Thread(target=cls.server.serve_forever)
-        cls.server_thread.daemon = True
-        cls.server_thread.start()
-        # サーバーが立ち上がるまで少し待つ (時間がかかる場合は適宜調整)
-        time.sleep(1)
+# ソケットを介さずにローカルのファイルを読み込む
+TEST_URL = "file://" + os.path.abspath("./tests/index.html")
 
-    @classmethod
-    def tearDownClass(cls):
-        # サーバーをシャットダウンする
-        cls.server.shutdown()
-        cls.server.server_close()
-        cls.server_thread.join()
 
+class TestBrowser(unittest.TestCase):
     def test_load(self):
-        test_url = "http://localhost:8000/tests/index.html"
+        test_url = TEST_URL
         Browser().load(test_url)
 
     def test_magnify(self):
-        test_url = "http://localhost:8000/tests/index.html"
+        test_url = TEST_URL
         browser = Browser()
         browser.load(test_url)
         expected_font_size = 16
@@ -46,7 +34,7 @@ class TestBrowser(unittest.TestCase):
 
     def test_reduce(self):
         expected_font_size = 16
-        test_url = "http://localhost:8000/tests/index.html"
+        test_url = TEST_URL
         browser = Browser()
         browser.load(test_url)
         expected_font_size = 16
@@ -0,0 +1,225 @@
+import unittest
+from html_parser import HTMLParser
+from css_parser import (
+    CSSParser, Selector, StyleSheet, collect_stylesheets, style, parse_inline_style, inline_style_stats,
+    INHERITED_PROPERTIES,
+)
+
+
+class TestCSSParser(unittest.TestCase):
+    def test_body(self):
+        pairs = CSSParser("background-color:lightblue; COLOR : red;;bad;width:10px").body()
+        self.assertEqual(pairs, {"background-color": "lightblue", "color": "red", "width": "10px"})
+
+    def test_values(self):
+        pairs = CSSParser(
+            """font-family: "Helvetica Neue", 'Noto Sans; JP', sans-serif;"""
+            " color: rgb(0, 128, 255) ; margin:0 auto  ;border: 1px solid #ccc"
+            "; content: 'a } b'; width: 10px !important; --custom-prop: x"
+        ).body()
+        self.assertEqual(pairs, {
+            "font-family": """"Helvetica Neue", 'Noto Sans; JP', sans-serif""",
+            "color": "rgb(0, 128, 255)",
+            "margin": "0 auto",
+            "border": "1px solid #ccc",
+            "content": "'a } b'",
+            "width": "10px",
+            "--custom-prop": "x",
+        })
+
+    def test_error_recovery(self):
+        cases = [
+            ("color: ; width: 1px", {"width": "1px"}),
+            ("color: 'unterminated; width: 1px", {"width": "1px"}),
+            (": red; :; ;; width:1px;", {"width": "1px"}),
+            ("color red; width: 1px", {"width": "1px"}),
+            ("color: red } width: 1px", {"color": "red"}),
+            ("color: rgb(1, 2; width: 1px", {"width": "1px"}),
+            ("a: b}; c: d", {"a": "b", "c": "d"}),
+            ("color: red ! important; width: 1px!ie", {"color": "red", "width": "1px"}),
+            ("color: red !; width: 1px", {"width": "1px"}),
+            ("", {}),
+            ("   ", {}),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(CSSParser(text).body(), expected)
+
+    def test_priority_and_comments(self):
+        cases = [
+            ("background-color: blue !important", {"background-color": "blue"}),
+            ("background-color: yellow /* hi */", {"background-color": "yellow"}),
+            ("/* a */ color: /* b */ red /* c */; width: 1px", {"color": "red", "width": "1px"}),
+            ("color: red /* unterminated", {"color": "red"}),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(CSSParser(text).body(), expected)
+        rules = CSSParser("p { color: blue !important; width: 1px } div { color: red }").parse()
+        self.assertEqual([body for _, body in rules], [
+            {"color": "blue", "width": "1px"}, {"color": "red"},
+        ])
+
+    def test_parse(self):
+        rules = CSSParser("""
+            /* comment { } */
+            p { color: red }
+            div.note, #main { background-color: blue; bad; width: 1px; }
+            @media print { p { color: black } }
+            div > p { color: green }
+            ul li a.x { color: gray; }
+        """).parse()
+        self.assertEqual(
+            [(selector.text, body) for selector, body in rules],
+            [
+                ("p", {"color": "red"}),
+                ("div.note", {"background-color": "blue", "width": "1px"}),
+                ("#main", {"background-color": "blue", "width": "1px"}),
+                ("ul li a.x", {"color": "gray"}),
+            ],
+        )
+
+
+class TestSelector(unittest.TestCase):
+    def setUp(self):
+        root = HTMLParser(
+            '<html><body><div id="main" class="box"><ul><li><a class="x y">a</a></li></ul></div>'
+            '<p class="x">b</p></body></html>'
+        ).parse()
+        body = root.children[0]
+        self.div, self.p = body.children
+        self.a = self.div.children[0].children[0].children[0]
+
+    def test_matches(self):
+        cases = [
+            ("a", True), ("A", True), ("p", False), ("a.x", True), ("a.x.y", True),
+            ("a.z", False), (".y", True), ("*", True), ("div a", True), ("#main a.x", True),
+            ("body div ul li a", True), ("p a", False), ("li div a", False), ("div.box * a", True),
+        ]
+        for text, expected in cases:
+            with self.subTest(selector=text):
+                self.assertEqual(Selector(text).matches(self.a), expected)
+
+    def test_specificity(self):
+        self.assertEqual(Selector("div#main ul li.a.b").specificity, (1, 2, 3))
+        self.assertEqual(Selector("*").specificity, (0, 0, 0))
+
+    def test_buckets(self):
+        rules = StyleSheet()
+        rules.add_css("a { color: red } .x { color: blue } #main .x { color: green } p { color: gray }")
+        self.assertEqual(len(rules), 4)
+        # 右端のキーが違うルールは照合しない
+        self.assertEqual(len(rules.candidates(self.a)), 3)
+        self.assertEqual(rules.match(self.a), [{"color": "red"}, {"color": "blue"}, {"color": "green"}])
+        self.assertEqual(rules.match(self.p), [{"color": "gray"}, {"color": "blue"}])
+
+
+class TestStyle(unittest.TestCase):
+    def test_cascade(self):
+        root = HTMLParser(
+            '<html><head><style>p { color: red; font-size: 10px } .a { color: blue }'
+            '#b { color: green }</style><link rel="stylesheet" href="extra.css"></head>'
+            '<body><p class="a">1</p><p class="a" id="b" style="font-size: 20px">2</p><p>3</p></body></html>'
+        ).parse()
+        fetched = []
+
+        def fetch(href):
+            fetched.append(href)
+            return "p { color: gray }"
+
+        style(root, collect_stylesheets(root, fetch))
+        self.assertEqual(fetched, ["extra.css"])
+        first, second, third = root.children[1].children
+        self.assertEqual(first.style["color"], "blue")
+        self.assertEqual(first.style["font-size"], "10px")
+        self.assertEqual(second.style["color"], "green")
+        self.assertEqual(second.style["font-size"], "20px")
+        # 詳細度が同じなら後のルールが勝つ
+        self.assertEqual(third.style["color"], "gray")
+        self.assertEqual(third.style["font-size"], "10px")
+
+    def test_without_rules(self):
+        root = HTMLParser('<html><p style="color:red">x</p></html>').parse()
+        style(root)
+        self.assertEqual(dict(root.children[0].style), dict(INHERITED_PROPERTIES, color="red"))
+        self.assertEqual(dict(root.style), INHERITED_PROPERTIES)
+
+    def test_inheritance(self):
+        root = HTMLParser(
+            '<html><body style="color: red; background-color: gray; font-size: 20px">'
+            '<div style="font-size: 150%; font-weight: bold"><p style="font-size: .5em">'
+            'x</p></div></body></html>'
+        ).parse()
+        style(root)
+        body = root.children[0]
+        div = body.children[0]
+        p = div.children[0]
+        self.assertEqual(div.style["color"], "red")
+        self.assertEqual(div.style["font-size"], "30px")
+        # background-color は継承しない
+        self.assertNotIn("background-color", div.style)
+        self.assertEqual(p.style["font-size"], "15px")
+        self.assertEqual(p.style["font-weight"], "bold")
+        # テキストは継承するプロパティだけを持つ
+        self.assertEqual(dict(p.children[0].style), {
+            "font-size": "15px", "font-weight": "bold", "font-style": "normal", "color": "red",
+        })
+
+    def test_style_sharing(self):
+        rules = StyleSheet()
+        rules.add_css("li { color: blue } .odd { font-style: italic } ul li.odd { font-weight: bold }")
+        items = "".join('<li class="{}">{}</li>'.format("odd" if i % 2 else "even", i) for i in range(100))
+        root = HTMLParser("<html><ul>" + items + "</ul><ul>" + items + "</ul></html>").parse()
+        resolver = style(root, rules)
+        first, second = root.children
+        self.assertIs(first.children[1].style, first.children[99].style)
+        self.assertIsNot(first.children[0].style, first.children[1].style)
+        self.assertEqual(first.children[1].style["font-weight"], "bold")
+        self.assertEqual(first.children[0].style["font-weight"], "normal")
+        # テキストノードは親のスタイルごとに 1 つの辞書を共有する
+        self.assertIs(first.children[1].children[0].style, first.children[3].children[0].style)
+        # html、ul 2 つ、各 ul の li 2 種類だけを計算する
+        self.assertEqual(resolver.computed, 1 + 1 + 2 + 2)
+        self.assertEqual(resolver.shared, 1 + 98 * 2)
+        with self.assertRaises(TypeError):
+            first.style["color"] = "red"
+
+
+class TestInlineStyleCache(unittest.TestCase):
+    def setUp(self):
+        parse_inline_style.cache_clear()
+
+    def test_shared(self):
+        rows = "".join('<p style="color: red; font-size: 12px">{}</p>'.format(i) for i in range(100))
+        root = HTMLParser('<html><body>' + rows + '<p style="color: blue">x</p><p>y</p></body></html>').parse()
+        style(root)
+        paragraphs = root.children[0].children
+        self.assertEqual(paragraphs[0].style["color"], "red")
+        self.assertEqual(paragraphs[0].style["font-size"], "12px")
+        self.assertIs(paragraphs[0].style, paragraphs[99].style)
+        self.assertEqual(paragraphs[100].style["color"], "blue")
+        self.assertEqual(dict(paragraphs[101].style), INHERITED_PROPERTIES)
+        # 共有する辞書は書き換えられない
+        with self.assertRaises(TypeError):
+            paragraphs[0].style["color"] = "green"
+
+        stats = inline_style_stats()
+        # 兄弟で共有したスタイルは style 属性を読み直さない
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["hits"], 0)
+
+        other = HTMLParser('<html><div><p style="color: blue">z</p></div></html>').parse()
+        style(other)
+        self.assertEqual(inline_style_stats()["hits"], 1)
+        self.assertAlmostEqual(inline_style_stats()["hit_rate"], 1 / 3)
+
+    def test_merged_with_rules(self):
+        rules = StyleSheet()
+        rules.add_css("p { color: gray; font-size: 10px }")
+        root = HTMLParser('<html><p style="color: red">x</p><p>y</p><p>z</p></html>').parse()
+        style(root, rules)
+        first, second, third = root.children
+        self.assertEqual(first.style["color"], "red")
+        self.assertEqual(first.style["font-size"], "10px")
+        # 一致したルールが 1 つだけなら、その宣言を共有する
+        self.assertIs(second.style, third.style)
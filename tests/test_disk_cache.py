@@ -0,0 +1,37 @@
+import unittest
+import os
+import tempfile
+from disk_cache import DiskLRUCache
+
+
+class TestDiskLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_and_index(self):
+        cache = DiskLRUCache(self.directory.name, 100, [".body", ".meta"])
+        cache.write("a", {".body": b"aaaa", ".meta": b"{}"})
+        cache.write("b", {".body": b"bb", ".meta": b"{}"})
+        # 先頭の拡張子のファイルのサイズだけを数える
+        self.assertEqual(cache.stats(), {"evictions": 0, "entries": 2, "size": 6})
+
+        # ファイルが揃っていないエントリは読み込まない
+        os.remove(cache.path("b", ".meta"))
+        cache = DiskLRUCache(self.directory.name, 100, [".body", ".meta"])
+        self.assertEqual(list(cache.entries), ["a"])
+        self.assertEqual(cache.size, 4)
+
+    def test_evict(self):
+        cache = DiskLRUCache(self.directory.name, 5, [".dom"])
+        cache.write("a", {".dom": b"aa"})
+        cache.write("b", {".dom": b"bb"})
+        cache.touch("a")
+        cache.write("c", {".dom": b"cc"})
+        self.assertEqual(list(cache.entries), ["a", "c"])
+        self.assertFalse(os.path.exists(cache.path("b", ".dom")))
+        self.assertEqual(cache.evictions, 1)
+        cache.clear()
+        self.assertEqual((cache.size, os.listdir(self.directory.name)), (0, []))
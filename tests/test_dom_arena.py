@@ -0,0 +1,69 @@
+import unittest
+import pickle
+from html_parser import Element, HTMLParser
+from css_parser import style
+from layout import DocumentLayout, layout_tree
+from headless import HeadlessFont, dump_display_list
+from dom_arena import ArenaDOM, ArenaBuilder, ElementView, TextView
+from test_html_parser import dump_tree
+
+
+def display(dom_node):
+    style(dom_node)
+    document = DocumentLayout(dom_node=dom_node, font_factory=HeadlessFont)
+    document.layout()
+    display_list = []
+    layout_tree(document, display_list)
+    return dump_display_list(display_list)
+
+
+class TestArenaDOM(unittest.TestCase):
+    def setUp(self):
+        with open("./tests/index.html") as file:
+            self.body = file.read()
+
+    def test_same_tree(self):
+        tree = HTMLParser(self.body).parse()
+        dom = ArenaDOM.from_tree(tree)
+        self.assertEqual(dump_tree(dom.root), dump_tree(tree))
+        self.assertEqual(dump_tree(dom.to_tree()), dump_tree(tree))
+
+    def test_views(self):
+        dom = ArenaDOM.from_tree(HTMLParser('<html><p id="a">x</p></html>').parse())
+        root = dom.root
+        self.assertIsInstance(root, ElementView)
+        self.assertIsInstance(root, Element)
+        p = root.children[0]
+        self.assertIs(p.parent, root)
+        self.assertIs(root.children[0], p)
+        self.assertEqual(p.attribute, {"id": "a"})
+        self.assertIsInstance(p.children[0], TextView)
+        self.assertEqual(p.children[0].text, "x")
+        self.assertEqual(len(dom), 3)
+
+    def test_pickle(self):
+        tree = HTMLParser(self.body).parse()
+        dom = pickle.loads(pickle.dumps(ArenaDOM.from_tree(tree)))
+        self.assertEqual(dump_tree(dom.root), dump_tree(tree))
+
+    def test_layout(self):
+        # ビューのままスタイルとレイアウトを通しても、同じ描画命令になる
+        expected = display(HTMLParser(self.body).parse())
+        dom = ArenaDOM.from_tree(HTMLParser(self.body).parse())
+        self.assertEqual(display(dom.root), expected)
+
+    def test_quoted_attribute(self):
+        tree = HTMLParser("""<html><p title='say "hi" &amp; &#39;bye&#39;'>x</p></html>""").parse()
+        title = tree.children[0].attribute["title"]
+        self.assertEqual(title, """say "hi" & 'bye'""")
+        # パース済みの属性は文字列に戻して持つ
+        dom = ArenaDOM.from_tree(tree)
+        self.assertEqual(dom.root.children[0].attribute["title"], title)
+
+    def test_builder(self):
+        # イベントから直接作っても、ツリーから詰め替えたものと同じになる
+        tree = HTMLParser(self.body).parse()
+        dom = ArenaBuilder().parse(self.body)
+        self.assertEqual(dump_tree(dom.root), dump_tree(tree))
+        self.assertEqual(list(dom.tag), list(ArenaDOM.from_tree(tree).tag))
+        self.assertEqual(dump_tree(ArenaBuilder().parse("").root), ("element", "html", {}, []))
@@ -0,0 +1,63 @@
+import unittest
+import os
+import tempfile
+from html_parser import HTMLParser
+from dom_arena import ArenaDOM
+from dom_snapshot import SnapshotCache, dumps, loads, load, HEADER
+from test_html_parser import dump_tree
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        with open("./tests/index.html") as file:
+            self.body = file.read()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        tree = HTMLParser(self.body + "<p title='日本語'>テキスト</p>").parse()
+        data = dumps(ArenaDOM.from_tree(tree))
+        self.assertEqual(dump_tree(loads(data).root), dump_tree(tree))
+
+        path = os.path.join(self.directory.name, "index.dom")
+        with open(path, "wb") as file:
+            file.write(data)
+        self.assertEqual(dump_tree(load(path).root), dump_tree(tree))
+
+    def test_invalid(self):
+        data = dumps(ArenaDOM.from_tree(HTMLParser(self.body).parse()))
+        for broken in [b"", data[:HEADER.size - 1], data[:-1], b"X" + data[1:]]:
+            with self.assertRaises(ValueError):
+                loads(broken)
+
+    def test_cache(self):
+        cache = SnapshotCache(self.directory.name)
+        self.assertIsNone(cache.lookup(self.body))
+        tree = HTMLParser(self.body).parse()
+        cache.store(self.body, tree)
+
+        # 別のインスタンスでもディスクから読み込める
+        cache = SnapshotCache(self.directory.name)
+        dom = cache.lookup(self.body)
+        self.assertEqual(dump_tree(dom.root), dump_tree(tree))
+        self.assertIsNone(cache.lookup(self.body + " "))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+        # 壊れたファイルは捨てる
+        with open(cache.path(cache.key(self.body), ".dom"), "wb") as file:
+            file.write(b"broken")
+        self.assertIsNone(cache.lookup(self.body))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_evict(self):
+        tree = HTMLParser(self.body).parse()
+        size = len(dumps(ArenaDOM.from_tree(tree)))
+        cache = SnapshotCache(self.directory.name, max_size=size * 2)
+        for body in ["a", "b", "c"]:
+            cache.store(self.body + body, tree)
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertIsNone(cache.lookup(self.body + "a"))
+        self.assertIsNotNone(cache.lookup(self.body + "c"))
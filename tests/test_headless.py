@@ -0,0 +1,116 @@
+import unittest
+import os
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from headless import HeadlessFont, render, dump_display_list, dump_layout, main
+
+TEST_URL = "file://" + os.path.abspath("./tests/index.html")
+
+
+class TestHeadlessFont(unittest.TestCase):
+    def test_measure(self):
+        font = HeadlessFont(size=20)
+        self.assertEqual(font.measure("abcd"), 44)
+        # 全角文字は半角文字の 2 倍の幅
+        self.assertEqual(font.measure("あい"), 44)
+        self.assertGreater(HeadlessFont(size=20, weight="bold").measure("abcd"), 44)
+
+    def test_metrics(self):
+        font = HeadlessFont(size=20, weight="bold", slant="italic")
+        metrics = font.metrics()
+        self.assertEqual(metrics["linespace"], metrics["ascent"] + metrics["descent"])
+        self.assertEqual(font.metrics("ascent"), metrics["ascent"])
+        self.assertEqual(font["size"], 20)
+        self.assertEqual(font.configure()["slant"], "italic")
+
+
+class TestHeadless(unittest.TestCase):
+    def test_render(self):
+        document, display_list = render(TEST_URL)
+        self.assertEqual(display_list[0].text, "Normal")
+        self.assertIsInstance(display_list[0].font, HeadlessFont)
+
+        lines = dump_display_list(display_list).splitlines()
+        self.assertEqual(lines[0].split("\t")[:4], ["text", "13", "19.75", "Normal"])
+        self.assertTrue(any(line.startswith("rect\t") for line in lines))
+        self.assertTrue(dump_layout(document).startswith("document x=13 y=16 width=774"))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            listing = os.path.join(directory, "urls.txt")
+            with open(listing, "w") as file:
+                file.write("data:text/html,<p>hello</p>\n")
+            output = os.path.join(directory, "out")
+            status = main(["./tests/index.html", "-i", listing, "-o", output, "-j", "2"])
+            self.assertEqual(status, 0)
+            self.assertEqual(
+                sorted(os.listdir(output)), ["00000-index.html.txt", "00001-p_.txt"]
+            )
+            with open(os.path.join(output, "00001-p_.txt")) as file:
+                self.assertEqual(file.read().split("\t")[3], "hello")
+
+    def test_main_failure(self):
+        with tempfile.TemporaryDirectory() as directory:
+            status = main([os.path.join(directory, "missing.html"), "-o", directory, "-j", "1"])
+            self.assertEqual(status, 1)
+
+    def test_stylesheets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "css"))
+            with open(os.path.join(directory, "css", "site.css"), "w") as file:
+                file.write("div.note { background-color: yellow }")
+            with open(os.path.join(directory, "index.html"), "w") as file:
+                file.write(
+                    '<html><head><link rel="stylesheet" href="css/site.css">'
+                    '<link rel="stylesheet" href="missing.css">'
+                    "<style>#main { background-color: red }</style></head>"
+                    '<body><div class="note"><p>a</p></div><div id="main"><p>b</p></div></body></html>'
+                )
+            document, display_list = render("file://" + os.path.join(directory, "index.html"))
+        colors = [cmd.color for cmd in display_list if not hasattr(cmd, "text")]
+        self.assertEqual(colors, ["yellow", "red"])
+
+    def test_broken_stylesheets(self):
+        class BrokenHandler(BaseHTTPRequestHandler):
+            # /truncated.css は Content-Length より短いボディで、/gzip.css は壊れた gzip で応答する
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.send_response(200)
+                if self.path == "/gzip.css":
+                    body = b"not gzip"
+                    self.send_header("Content-Encoding", "gzip")
+                    self.send_header("Content-Length", str(len(body)))
+                else:
+                    body = b"p { color"
+                    self.send_header("Content-Length", "100")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("localhost", 0), BrokenHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            base = "http://localhost:{}/".format(server.server_address[1])
+            with tempfile.TemporaryDirectory() as directory:
+                with open(os.path.join(directory, "index.html"), "w") as file:
+                    file.write(
+                        '<html><head><link rel="stylesheet" href="{0}truncated.css">'
+                        '<link rel="stylesheet" href="{0}gzip.css">'
+                        "<style>p {{ background-color: red }}</style></head>"
+                        "<body><p>a</p></body></html>".format(base)
+                    )
+                # 壊れたスタイルシートは無視してページを表示する
+                document, display_list = render("file://" + os.path.join(directory, "index.html"))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        colors = [cmd.color for cmd in display_list if not hasattr(cmd, "text")]
+        self.assertEqual(colors, ["red"])
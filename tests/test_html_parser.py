@@ -1,5 +1,7 @@
 import unittest
-from html_parser import Element, Text, HTMLParser
+from html_parser import (
+    Element, Text, HTMLParser, Tokenizer, unescape, iter_events, START_TAG, END_TAG, TEXT,
+)
 
 
 class TestHTMLParser(unittest.TestCase):
@@ -233,3 +235,286 @@ class TestHTMLParser(unittest.TestCase):
         text_normal = element_body.children[19]
         self.assertIsInstance(text_normal, Text)
         self.assertEqual(text_normal.text, "Normal")
+
+
+class LegacyHTMLParser(HTMLParser):
+    """1 文字ずつテキストを連結していた以前の parse"""
+    def parse(self):
+        text = ""
+        in_tag = False
+        for c in self.body:
+            if c == "<":
+                in_tag = True
+                text = text.replace("\n", "")
+                text = text.strip()
+                if text:
+                    self.add_text(text)
+                text = ""
+            elif c == ">":
+                in_tag = False
+                self.add_tag(tag=text)
+                text = ""
+            else:
+                text += c
+        if not in_tag and text:
+            self.add_text(text=text)
+        return self.close_unfinished_node()
+
+
+def dump_tree(node):
+    if isinstance(node, Text):
+        return ("text", node.text)
+    return (
+        "element", node.tag, node.attribute,
+        [dump_tree(child) for child in node.children],
+    )
+
+
+class TestTokenizer(unittest.TestCase):
+    def test_same_tree_as_legacy_parser(self):
+        with open("./tests/index.html") as file:
+            test_body = file.read()
+        cases = [
+            test_body,
+            "<html><body>a > b</body></html>",
+            "<p>trailing text",
+            "<p>unterminated <b",
+            "<html>\n  <p>\n  spaced   text  \n</p>\n</html>\n",
+            "<div><br/><img src='x.png'>after</div></div></div>",
+            "<p>" + "long text " * 1000 + "</p>",
+        ]
+        for body in cases:
+            with self.subTest(body=body[:40]):
+                self.assertEqual(
+                    dump_tree(HTMLParser(body).parse()),
+                    dump_tree(LegacyHTMLParser(body).parse()),
+                )
+
+
+class TestFeed(unittest.TestCase):
+    def test_same_tree_as_parse(self):
+        with open("./tests/index.html") as file:
+            test_body = file.read()
+        expected = dump_tree(HTMLParser(test_body).parse())
+        # タグやテキストやマルチバイト文字がチャンクの境界で切れても同じツリーになる
+        for size in [1, 2, 3, 7, 64, len(test_body)]:
+            with self.subTest(size=size):
+                parser = HTMLParser()
+                for i in range(0, len(test_body), size):
+                    parser.feed(test_body[i:i + size])
+                self.assertEqual(dump_tree(parser.close()), expected)
+
+    def test_partial_tree(self):
+        parser = HTMLParser()
+        parser.feed("<html><body><p>Hello</p><p>Wor")
+        root = parser.root
+        self.assertEqual(root.tag, "html")
+        body = root.children[0]
+        self.assertEqual([child.tag for child in body.children], ["p", "p"])
+        self.assertEqual(body.children[0].children[0].text, "Hello")
+        # 区切り文字が来るまでテキストは確定しない
+        self.assertEqual(body.children[1].children, [])
+
+        parser.feed("ld</p></body></html>")
+        self.assertEqual(body.children[1].children[0].text, "World")
+        self.assertIs(parser.close(), root)
+
+    def test_unterminated_tag(self):
+        parser = HTMLParser()
+        parser.feed("<html>text<b")
+        root = parser.close()
+        self.assertEqual(dump_tree(root), ("element", "html", {}, [("text", "text")]))
+
+
+class TestCompactNodes(unittest.TestCase):
+    def test_slots(self):
+        root = HTMLParser('<html><p class="a">x</p><p class="b">y</p></html>').parse()
+        first, second = root.children
+        self.assertFalse(hasattr(first, "__dict__"))
+        self.assertFalse(hasattr(first.children[0], "__dict__"))
+        # テキストノードは空の子を共有する
+        self.assertIs(first.children[0].children, second.children[0].children)
+        # タグ名と属性名は intern される
+        self.assertIs(first.tag, second.tag)
+        self.assertIs(next(iter(first.attribute)), next(iter(second.attribute)))
+
+
+class TestLazyAttribute(unittest.TestCase):
+    def test_quoted_values(self):
+        tag, attribute = HTMLParser().get_attribute(
+            """a href='/x y' title="a > b = c" data-x = 1 hidden CLASS=z /"""
+        )
+        self.assertEqual(tag, "a")
+        self.assertEqual(attribute, {
+            "href": "/x y", "title": "a > b = c", "data-x": "1",
+            "hidden": "", "class": "z", "/": "",
+        })
+        self.assertEqual(HTMLParser().get_attribute('p title=""')[1], {"title": ""})
+
+    def test_quoted_delimiters(self):
+        # 引用符で囲まれた属性値の中の > と < はタグの区切りとして読まない
+        body = """<html><p title="a > b" data-x='<i>' class=c>x</p><p a=">">y</p></html>"""
+        for size in [1, 3, len(body)]:
+            with self.subTest(size=size):
+                parser = HTMLParser()
+                for i in range(0, len(body), size):
+                    parser.feed(body[i:i + size])
+                root = parser.close()
+                first, second = root.children
+                self.assertEqual(first.attribute, {"title": "a > b", "data-x": "<i>", "class": "c"})
+                self.assertEqual(first.children[0].text, "x")
+                self.assertEqual(second.attribute, {"a": ">"})
+                self.assertEqual(second.children[0].text, "y")
+
+    def test_parse_on_first_access(self):
+        root = HTMLParser('<html><p style="color: red" title=a>x</p></html>').parse()
+        p = root.children[0]
+        # 読まれるまでは文字列のまま
+        self.assertEqual(p._attribute, 'style="color: red" title=a')
+        self.assertEqual(p.attribute, {"style": "color: red", "title": "a"})
+        self.assertIs(p.attribute, p.attribute)
+        self.assertEqual(root.attribute, {})
+
+
+class TestIndex(unittest.TestCase):
+    def test_index(self):
+        parser = HTMLParser(
+            '<html><body><div id="main" class="box wide">'
+            '<p class="box">a</p><p CLASS=note>b</p><img id="main" src="x">'
+            '<p style="color:red">c</p></div></body></html>'
+        )
+        root = parser.parse()
+        div = root.children[0].children[0]
+        first, second, img, third = div.children
+
+        self.assertIs(parser.get_element_by_id("main"), div)
+        self.assertIsNone(parser.get_element_by_id("none"))
+        self.assertEqual(parser.get_elements_by_tag_name("P"), [first, second, third])
+        self.assertEqual(parser.get_elements_by_tag_name("img"), [img])
+        self.assertEqual(parser.get_elements_by_class_name("box"), [div, first])
+        self.assertEqual(parser.get_elements_by_class_name("wide box"), [div])
+        self.assertEqual(parser.get_elements_by_class_name("note"), [second])
+        self.assertEqual(parser.get_elements_by_class_name("none"), [])
+        self.assertEqual(parser.get_elements_by_class_name(" "), [])
+        # id も class もない要素の属性はパースしない
+        self.assertIsInstance(third._attribute, str)
+
+    def test_class_name_rarest_not_first(self):
+        parser = HTMLParser(
+            "<html><body>" + '<p class="a">x</p>' * 5
+            + '<p class="b">y</p><p class="a b">z</p></body></html>'
+        )
+        root = parser.parse()
+        both = root.children[0].children[-1]
+        self.assertEqual(parser.get_elements_by_class_name("a b"), [both])
+        self.assertEqual(parser.get_elements_by_class_name("b a"), [both])
+
+
+class TestUnescape(unittest.TestCase):
+    def test_unescape(self):
+        cases = [
+            ("no references", "no references"),
+            ("a &amp; b &lt;p&gt;", "a & b <p>"),
+            ("&#x3042;&#X3044;&#12358;", "あいう"),
+            ("&copy 2023 &copy2023", "© 2023 ©2023"),
+            ("&nbsp;&hellip;&NotEqualTilde;", "\xa0…≂̸"),
+            ("&#128; &#0; &#xD800; &#x110000;", "€ � � �"),
+            ("&unknown; & &#; &#xg;", "&unknown; & &#; &#xg;"),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(unescape(text), expected)
+
+    def test_attribute(self):
+        cases = [
+            ("/s?q=1&region=us&section=2", "/s?q=1&region=us&section=2"),
+            ("?a=1&amp=2&copy=3", "?a=1&amp=2&copy=3"),
+            ("&copy 2023 &copy2023 &amp; &amp", "© 2023 &copy2023 & &"),
+            ("&reg;ion &#38;x &unknown", "®ion &x &unknown"),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(unescape(text, in_attribute=True), expected)
+        p = HTMLParser('<html><a href="/s?q=1&region=us&section=2">x</a></html>').parse().children[0]
+        self.assertEqual(p.attribute["href"], "/s?q=1&region=us&section=2")
+
+    def test_parse(self):
+        root = HTMLParser(
+            '<html><p title="&quot;a&quot; &amp; b">1 &lt; 2 &amp;&amp; 3 &gt; 2</p></html>'
+        ).parse()
+        p = root.children[0]
+        self.assertEqual(p.children[0].text, "1 < 2 && 3 > 2")
+        self.assertEqual(p.attribute["title"], '"a" & b')
+
+
+class TestRawText(unittest.TestCase):
+    BODY = (
+        "<html><head><style>p > b { color: red }</style>"
+        "<script>if (a < b && c > d) { x = '</p>'; }</SCRIPT ></head>"
+        "<body><!-- <p>commented</p> -- > --><p>a &amp; b</p>"
+        "<script type=module>let s = `&amp;`</script><!----></body></html>"
+    )
+
+    def test_raw_text(self):
+        root = HTMLParser(self.BODY).parse()
+        head, body = root.children
+        style, script = head.children
+        self.assertEqual(dump_tree(style), ("element", "style", {}, [("text", "p > b { color: red }")]))
+        self.assertEqual(script.children[0].text, "if (a < b && c > d) { x = '</p>'; }")
+        # コメントは捨て、script の中身は文字参照を含めて書かれたまま
+        self.assertEqual(
+            [dump_tree(child) for child in body.children],
+            [
+                ("element", "p", {}, [("text", "a & b")]),
+                ("element", "script", {"type": "module"}, [("text", "let s = `&amp;`")]),
+            ],
+        )
+
+    def test_split_across_chunks(self):
+        expected = dump_tree(HTMLParser(self.BODY).parse())
+        for size in range(1, 12):
+            with self.subTest(size=size):
+                parser = HTMLParser()
+                for i in range(0, len(self.BODY), size):
+                    parser.feed(self.BODY[i:i + size])
+                self.assertEqual(dump_tree(parser.close()), expected)
+
+    def test_unterminated(self):
+        root = HTMLParser("<html><script>a < b").parse()
+        self.assertEqual(root.children[0].children[0].text, "a < b")
+        root = HTMLParser("<html><p>x</p><!-- <p>y</p>").parse()
+        self.assertEqual(len(root.children), 1)
+        root = HTMLParser("<html>x<!-").parse()
+        self.assertEqual(dump_tree(root), ("element", "html", {}, [("text", "x")]))
+
+
+class TestEvents(unittest.TestCase):
+    def test_iter_events(self):
+        chunks = ['<!doctype html><html><p class="a">x &amp; ', "y</p><br/><scr", "ipt>a<b</script></html>"]
+        self.assertEqual(list(iter_events(chunks)), [
+            (START_TAG, "html", ""),
+            (START_TAG, "p", 'class="a"'),
+            (TEXT, "x & y"),
+            (END_TAG, "p"),
+            (START_TAG, "br", ""),
+            (START_TAG, "script", ""),
+            (TEXT, "a<b"),
+            (END_TAG, "script"),
+            (END_TAG, "html"),
+        ])
+
+    def test_text_extraction(self):
+        # ツリーを作らずにテキストだけを取り出す
+        class TextExtractor(Tokenizer):
+            def __init__(self):
+                super().__init__()
+                self.words = 0
+
+            def handle_text(self, text):
+                self.words += len(text.split())
+
+        extractor = TextExtractor()
+        for _ in range(1000):
+            extractor.feed("<p>one two <b>three</b></p>")
+        extractor.close()
+        self.assertEqual(extractor.words, 3000)
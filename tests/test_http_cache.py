@@ -0,0 +1,96 @@
+import unittest
+import tempfile
+import time
+from email.utils import formatdate
+from http_cache import HTTPCache, CacheEntry, parse_cache_control
+
+
+class TestCacheEntry(unittest.TestCase):
+    def test_parse_cache_control(self):
+        self.assertEqual(
+            parse_cache_control('public, max-age=60, no-cache="set-cookie"'),
+            {"public": None, "max-age": "60", "no-cache": "set-cookie"},
+        )
+
+    def test_freshness_lifetime(self):
+        now = time.time()
+        cases = [
+            ({"cache-control": "max-age=60"}, 60),
+            ({"cache-control": "max-age=60, no-cache"}, 0),
+            ({"date": formatdate(now), "expires": formatdate(now + 100)}, 100),
+            ({"expires": "0"}, 0),
+            ({"date": formatdate(now), "last-modified": formatdate(now - 1000)}, 100),
+            ({}, 0),
+        ]
+        for headers, expected in cases:
+            with self.subTest(headers=headers):
+                entry = CacheEntry("http://example.org/", headers, b"", now)
+                self.assertAlmostEqual(entry.freshness_lifetime(), expected, delta=1)
+
+    def test_is_fresh(self):
+        entry = CacheEntry("http://example.org/", {"cache-control": "max-age=60", "age": "30"}, b"", 0)
+        self.assertTrue(entry.is_fresh(now=20))
+        self.assertFalse(entry.is_fresh(now=40))
+
+    def test_validators(self):
+        entry = CacheEntry(
+            "http://example.org/", {"etag": '"abc"', "last-modified": "Mon, 01 Jan 2024 00:00:00 GMT"}, b"", 0
+        )
+        self.assertEqual(
+            entry.validators(),
+            {"If-None-Match": '"abc"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"},
+        )
+
+
+class TestHTTPCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_and_lookup(self):
+        cache = HTTPCache(self.directory.name)
+        cache.store("http://example.org/", {"etag": '"a"', "content-length": "4"}, b"body")
+        entry = cache.lookup("http://example.org/")
+        self.assertEqual(entry.body, b"body")
+        self.assertEqual(entry.headers, {"etag": '"a"'})
+        self.assertIsNone(cache.lookup("http://example.org/other"))
+
+        # 別のインスタンスからもディスク上のエントリを読める
+        cache = HTTPCache(self.directory.name)
+        self.assertEqual(cache.lookup("http://example.org/").body, b"body")
+
+    def test_stats(self):
+        cache = HTTPCache(self.directory.name)
+        url = "http://example.org/"
+        self.assertEqual(cache.lookup_fresh(url), (None, False))
+        cache.store(url, {"cache-control": "max-age=60", "etag": '"a"'}, b"body")
+        entry, fresh = cache.lookup_fresh(url)
+        self.assertTrue(fresh)
+        entry, fresh = cache.lookup_fresh(url, now=entry.response_time + 120)
+        self.assertFalse(fresh)
+        cache.update(entry, {"cache-control": "max-age=60"})
+        cache.store("http://example.org/private", {"cache-control": "no-store"}, b"x")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["revalidated"], stats["misses"]), (1, 1, 2))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_no_store(self):
+        cache = HTTPCache(self.directory.name)
+        self.assertFalse(cache.store("http://example.org/", {"cache-control": "no-store"}, b"body"))
+        self.assertIsNone(cache.lookup("http://example.org/"))
+
+    def test_lru_eviction(self):
+        cache = HTTPCache(self.directory.name, max_size=10)
+        cache.store("http://example.org/a", {}, b"aaaa")
+        cache.store("http://example.org/b", {}, b"bbbb")
+        # a にアクセスしたので、次に追い出されるのは b
+        cache.lookup("http://example.org/a")
+        cache.store("http://example.org/c", {}, b"cccc")
+
+        self.assertIsNotNone(cache.lookup("http://example.org/a"))
+        self.assertIsNone(cache.lookup("http://example.org/b"))
+        self.assertIsNotNone(cache.lookup("http://example.org/c"))
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.stats()["size"], 8)
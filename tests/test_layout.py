@@ -4,7 +4,8 @@ from tkinter.font import Font
 from browser import layout_tree
 from html_parser import Text, Element, HTMLParser
 from css_parser import style
-from layout import DocumentLayout, BlockLayout, DrawRect, DrawText
+from layout import DocumentLayout, BlockLayout, DrawRect, DrawText, tk_color
+from headless import HeadlessFont
 
 class TestBlockLayout(unittest.TestCase):
     def setUp(self):
@@ -1079,3 +1080,41 @@ class TestDocumentLayout(unittest.TestCase):
                     self.assertEqual(
                         display_list[i].font.configure()["slant"], exp["font_style"]
                     )
+
+
+class TestDeepNesting(unittest.TestCase):
+    # 再帰の上限を大きく超える深さでも、スタイルとレイアウトができる
+    DEPTH = 20000
+
+    def render(self, body):
+        dom_node = HTMLParser(body).parse()
+        style(dom_node)
+        document = DocumentLayout(dom_node=dom_node, font_factory=HeadlessFont)
+        document.layout()
+        display_list = []
+        layout_tree(document, display_list)
+        return document, display_list
+
+    def test_nested_blocks(self):
+        body = "<html>" + "<div>" * self.DEPTH + "<p>deep</p>" + "</div>" * self.DEPTH + "</html>"
+        document, display_list = self.render(body)
+        self.assertEqual([cmd.text for cmd in display_list], ["deep"])
+        self.assertGreater(document.height, 0)
+
+    def test_nested_inline(self):
+        body = (
+            '<html><p style="background-color:red">' + "<b>" * self.DEPTH + "deep"
+            + "</b>" * self.DEPTH + " tail</p></html>"
+        )
+        document, display_list = self.render(body)
+        self.assertEqual([cmd.text for cmd in display_list if isinstance(cmd, DrawText)], ["deep", "tail"])
+        self.assertEqual(display_list[1].font["weight"], "bold")
+        self.assertEqual(display_list[2].font["weight"], "normal")
+
+
+class TestColor(unittest.TestCase):
+    def test_tk_color(self):
+        self.assertEqual(tk_color("rgb(0, 128, 255)"), "#0080ff")
+        self.assertEqual(tk_color("rgba(1,2,3,0.5)"), "#010203")
+        self.assertEqual(tk_color("rgb(300, 0, 0)"), "#ff0000")
+        self.assertEqual(tk_color("lightblue"), "lightblue")
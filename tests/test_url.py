@@ -0,0 +1,564 @@
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+import gzip
+import zlib
+import tempfile
+import asyncio
+import os
+import shutil
+import ssl
+import subprocess
+import urllib.parse
+import url as url_module
+from url import (
+    URL, ConnectionPool, ContentDecoder, DNSCache, RedirectCache, TLSSessionCache,
+    detect_charset, fetch_many, get_ssl_context,
+)
+from http_cache import HTTPCache
+
+LARGE_BODY = "<p>圧縮されたテキスト</p>\n" * 2000
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # /cached/ へのリクエスト回数
+    cached_requests = 0
+    # /redirect/ へのリクエスト回数
+    redirect_requests = 0
+    # /slow/ を同時に処理している数とその最大値
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path.startswith("/slow/"):
+            with self.lock:
+                KeepAliveHandler.in_flight += 1
+                KeepAliveHandler.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.1)
+            with self.lock:
+                KeepAliveHandler.in_flight -= 1
+        if self.path.startswith("/encoded/"):
+            return self.send_encoded()
+        if self.path.startswith("/cached/"):
+            return self.send_cached()
+        if self.path.startswith("/trickle/"):
+            return self.send_trickle()
+        if self.path.startswith("/charset/"):
+            return self.send_charset()
+        if self.path.startswith("/redirect/"):
+            return self.send_redirect()
+        body = "path={}".format(self.path).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_encoded(self):
+        # /encoded/<content-encoding>/<chunked|length>
+        _, _, encoding, framing = self.path.split("/")
+        assert "gzip" in self.headers["Accept-Encoding"]
+        body = LARGE_BODY.encode("utf8")
+        if encoding == "gzip":
+            body = gzip.compress(body)
+        elif encoding == "deflate":
+            body = zlib.compress(body)
+        elif encoding == "raw-deflate":
+            compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            encoding = "deflate"
+        self.send_response(200)
+        self.send_header("Content-Encoding", encoding)
+        if framing == "chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 100):
+                chunk = body[i:i + 100]
+                self.wfile.write("{:x};ext=1\r\n".format(len(chunk)).encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\nX-Trailer: 1\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def send_cached(self):
+        # /cached/<Cache-Control の値>
+        KeepAliveHandler.cached_requests += 1
+        etag = '"v1"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = "cached body".encode("utf8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", self.path.split("/", 2)[2])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_charset(self):
+        # /charset/header は Content-Type で、/charset/meta は <meta charset> で Shift_JIS を指定する。
+        # /charset/chunked は <meta charset> の途中で切れる小さなチャンクから送る
+        if self.path in ["/charset/meta", "/charset/chunked"]:
+            content_type = "text/html"
+            body = '<meta charset="Shift_JIS"><p>日本語</p>'
+        else:
+            content_type = "text/html; charset=shift_jis"
+            body = "<p>日本語</p>"
+        body = body.encode("shift_jis")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if self.path == "/charset/chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in [body[:15], body[15:]]:
+                self.wfile.write("{:x}\r\n".format(len(chunk)).encode() + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_redirect(self):
+        # /redirect/<status>/<残りのリダイレクト数> は数を減らしながらリダイレクトし、0 で /a に着く
+        KeepAliveHandler.redirect_requests += 1
+        _, _, status, count = self.path.split("/")
+        if count == "0":
+            location = "../../a"
+        else:
+            location = "{}".format(int(count) - 1)
+        body = b"moved"
+        self.send_response(int(status))
+        self.send_header("Location", location)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_trickle(self):
+        # チャンクを 0.1 秒おきに送る。マルチバイト文字をチャンクの境界で分割する
+        body = "あいうえお".encode("utf8")
+        self.send_response(200)
+        # charset の指定があるので、<meta charset> を探すために溜めずにすぐ返せる
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(body), 4):
+            chunk = body[i:i + 4]
+            self.wfile.write("{:x}\r\n".format(len(chunk)).encode() + chunk + b"\r\n")
+            self.wfile.flush()
+            time.sleep(0.1)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # HTTP/1.1 で応答するサーバーを空いているポートで立ち上げる
+        cls.server = ThreadingHTTPServer(("localhost", 0), KeepAliveHandler)
+        cls.server.daemon_threads = True
+        cls.port = cls.server.server_address[1]
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever)
+        cls.server_thread.daemon = True
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.server_thread.join()
+
+    def url(self, path):
+        return "http://localhost:{}{}".format(self.port, path)
+
+    def test_reuse_connection(self):
+        pool = ConnectionPool()
+        for path in ["/a", "/b", "/c"]:
+            headers, body = URL(self.url(path)).request(pool=pool)
+            self.assertEqual(body, "path={}".format(path))
+        self.assertEqual(pool.connects, 1)
+        self.assertEqual(pool.reuses, 2)
+        pool.clear()
+
+    def test_idle_timeout(self):
+        pool = ConnectionPool(idle_timeout=0.05)
+        URL(self.url("/a")).request(pool=pool)
+        time.sleep(0.1)
+        URL(self.url("/b")).request(pool=pool)
+        self.assertEqual(pool.connects, 2)
+        self.assertEqual(pool.reuses, 0)
+        pool.clear()
+
+    def test_max_per_host(self):
+        pool = ConnectionPool(max_per_host=1)
+        conn = pool.acquire("http", "localhost", self.port)
+        acquired = []
+        thread = threading.Thread(
+            target=lambda: acquired.append(pool.acquire("http", "localhost", self.port))
+        )
+        thread.start()
+        # 上限に達しているので返却されるまで待たされる
+        time.sleep(0.1)
+        self.assertEqual(acquired, [])
+        pool.release(conn)
+        thread.join(timeout=1)
+        self.assertIs(acquired[0], conn)
+        self.assertEqual(pool.connects, 1)
+        pool.discard(conn)
+
+    def test_retry_stale_connection(self):
+        pool = ConnectionPool()
+        URL(self.url("/a")).request(pool=pool)
+        # サーバー側で閉じられた接続を再利用しても新しい接続でやり直す
+        for conn in pool.idle[("http", "localhost", self.port)]:
+            conn.sock.shutdown(2)
+        headers, body = URL(self.url("/b")).request(pool=pool)
+        self.assertEqual(body, "path=/b")
+        self.assertEqual(pool.connects, 2)
+        pool.clear()
+
+    def test_retry_connect_failure(self):
+        # やり直しの接続にも失敗した場合、ホストごとの接続数が元に戻る
+        server = ThreadingHTTPServer(("localhost", 0), KeepAliveHandler)
+        server.daemon_threads = True
+        port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        pool = ConnectionPool(max_per_host=1)
+        url = URL("http://localhost:{}/a".format(port))
+        url.request(pool=pool)
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        for conn in pool.idle[("http", "localhost", port)]:
+            conn.sock.shutdown(2)
+        with self.assertRaises(ConnectionError):
+            url.request(pool=pool)
+        self.assertEqual(pool.opened[("http", "localhost", port)], 0)
+
+    def test_content_encoding(self):
+        pool = ConnectionPool()
+        for encoding in ["gzip", "deflate", "raw-deflate", "identity"]:
+            for framing in ["chunked", "length"]:
+                with self.subTest(encoding=encoding, framing=framing):
+                    path = "/encoded/{}/{}".format(encoding, framing)
+                    headers, body = URL(self.url(path)).request(pool=pool)
+                    self.assertEqual(body, LARGE_BODY)
+        # チャンク形式でも接続は再利用される
+        self.assertEqual(pool.connects, 1)
+        pool.clear()
+
+    def test_http_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = HTTPCache(directory)
+            for cache_control in ["max-age=60", "no-cache"]:
+                with self.subTest(cache_control=cache_control):
+                    KeepAliveHandler.cached_requests = 0
+                    url = URL(self.url("/cached/" + cache_control))
+                    for _ in range(3):
+                        headers, body = url.request(cache=cache)
+                        self.assertEqual(body, "cached body")
+                    # max-age の間はサーバーに問い合わせず、no-cache は毎回 304 で再検証する
+                    expected = 1 if cache_control == "max-age=60" else 3
+                    self.assertEqual(KeepAliveHandler.cached_requests, expected)
+            self.assertEqual(cache.misses, 2)
+            self.assertEqual(cache.hits, 2)
+            self.assertEqual(cache.revalidated, 2)
+
+    def test_request_async(self):
+        for framing in ["chunked", "length"]:
+            with self.subTest(framing=framing):
+                url = URL(self.url("/encoded/gzip/" + framing))
+                headers, body = asyncio.run(url.request_async())
+                self.assertEqual(body, LARGE_BODY)
+
+    def test_fetch_many(self):
+        KeepAliveHandler.max_in_flight = 0
+        paths = ["/slow/{}".format(i) for i in range(8)]
+        start = time.monotonic()
+        results = asyncio.run(fetch_many([self.url(path) for path in paths], concurrency=4))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual([body for _, body in results], ["path=" + path for path in paths])
+        self.assertEqual(KeepAliveHandler.max_in_flight, 4)
+        # 0.1 秒のリクエスト 8 件を 4 件ずつ並行して取得する
+        self.assertLess(elapsed, 0.8)
+
+    def test_fetch_many_return_exceptions(self):
+        urls = [self.url("/a"), "http://localhost:{}/b".format(self.port), "http://localhost:1/"]
+        results = asyncio.run(fetch_many(urls, return_exceptions=True))
+        self.assertEqual(results[0][1], "path=/a")
+        self.assertEqual(results[1][1], "path=/b")
+        self.assertIsInstance(results[2], OSError)
+
+    def test_stream(self):
+        pool = ConnectionPool()
+        start = time.monotonic()
+        headers, chunks = URL(self.url("/trickle/")).stream(pool=pool)
+        first = next(chunks)
+        first_byte = time.monotonic() - start
+        rest = list(chunks)
+        total = time.monotonic() - start
+
+        self.assertEqual(first + "".join(rest), "あいうえお")
+        self.assertGreater(len(rest), 1)
+        # 最初のチャンクはボディ全体を待たずに得られる
+        self.assertLess(first_byte, total / 2)
+        # 読み切った接続はプールに戻る
+        URL(self.url("/a")).request(pool=pool)
+        self.assertEqual(pool.reuses, 1)
+        pool.clear()
+
+    def test_stream_abandoned(self):
+        pool = ConnectionPool()
+        headers, chunks = URL(self.url("/trickle/")).stream(pool=pool)
+        next(chunks)
+        # 途中で読むのをやめた接続は再利用しない
+        chunks.close()
+        URL(self.url("/a")).request(pool=pool)
+        self.assertEqual(pool.connects, 2)
+        pool.clear()
+
+    def test_stream_unread(self):
+        pool = ConnectionPool(max_per_host=2)
+        _, first = URL(self.url("/trickle/")).stream(pool=pool)
+        _, second = URL(self.url("/trickle/")).stream(pool=pool)
+        # 一度も読まずに捨てたボディの接続も手放す
+        first.close()
+        del second
+        self.assertEqual(pool.opened[("http", "localhost", self.port)], 0)
+        headers, body = URL(self.url("/a")).request(pool=pool)
+        self.assertEqual(body, "path=/a")
+        pool.clear()
+
+    def test_charset(self):
+        for where in ["header", "meta", "chunked"]:
+            with self.subTest(where=where):
+                headers, body = URL(self.url("/charset/" + where)).request()
+                self.assertTrue(body.endswith("<p>日本語</p>"))
+                headers, chunks = URL(self.url("/charset/" + where)).stream()
+                self.assertEqual("".join(chunks), body)
+
+    def test_redirect(self):
+        for status in ["301", "302", "303", "307", "308"]:
+            with self.subTest(status=status):
+                redirects = RedirectCache()
+                url = URL(self.url("/redirect/{}/2".format(status)))
+                for _ in range(2):
+                    KeepAliveHandler.redirect_requests = 0
+                    headers, body = url.request(redirects=redirects)
+                    self.assertEqual(body, "path=/a")
+                    self.assertEqual(url.final_url, self.url("/a"))
+                # 恒久的なリダイレクトは 2 回目以降リクエストしない
+                expected = 0 if status in ["301", "308"] else 3
+                self.assertEqual(KeepAliveHandler.redirect_requests, expected)
+
+    def test_redirect_async(self):
+        redirects = RedirectCache()
+        url = URL(self.url("/redirect/301/2"))
+        headers, body = asyncio.run(url.request_async(redirects=redirects))
+        self.assertEqual(body, "path=/a")
+        self.assertEqual(redirects.lookup(url.url), self.url("/a"))
+        self.assertEqual(redirects.hits, 3)
+
+    def test_too_many_redirects(self):
+        with self.assertRaises(AssertionError):
+            URL(self.url("/redirect/302/5")).request(redirects=RedirectCache(), max_redirects=3)
+
+
+class TestResolve(unittest.TestCase):
+    def test_resolve(self):
+        base = URL("http://example.org:8000/dir/page.html?q=1")
+        cases = [
+            ("https://other.org/x", "https://other.org/x"),
+            ("//cdn.example.org/x.css", "http://cdn.example.org/x.css"),
+            ("/root.html", "http://example.org:8000/root.html"),
+            ("style.css", "http://example.org:8000/dir/style.css"),
+            ("../up.html?x=1", "http://example.org:8000/up.html?x=1"),
+            ("./a/../b/", "http://example.org:8000/dir/b/"),
+            ("..", "http://example.org:8000/"),
+        ]
+        for href, expected in cases:
+            with self.subTest(href=href):
+                self.assertEqual(base.resolve(href), expected)
+
+    def test_redirect_loop(self):
+        redirects = RedirectCache()
+        redirects.add("http://a/", "http://b/")
+        redirects.add("http://b/", "http://a/")
+        self.assertIn(redirects.lookup("http://a/"), ["http://a/", "http://b/"])
+
+
+class TestLocalURL(unittest.TestCase):
+    def test_file(self):
+        with open("./tests/index.html", encoding="utf8") as file:
+            test_body = file.read()
+        url = URL("file://" + os.path.abspath("./tests/index.html"))
+        headers, body = url.request()
+        self.assertEqual(body, test_body)
+        self.assertEqual(headers["content-type"], "text/html")
+        headers, chunks = url.stream()
+        self.assertEqual("".join(chunks), test_body)
+        headers, body = asyncio.run(url.request_async())
+        self.assertEqual(body, test_body)
+
+    def test_file_charset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "日本語 ページ.html")
+            with open(path, "wb") as file:
+                file.write('<meta charset="euc-jp"><p>日本語</p>'.encode("euc_jp"))
+            url = URL("file://" + urllib.parse.quote(path))
+            headers, body = url.request()
+            self.assertEqual(body, '<meta charset="euc-jp"><p>日本語</p>')
+
+            empty = os.path.join(directory, "empty.html")
+            open(empty, "w").close()
+            self.assertEqual(URL("file://" + empty).request()[1], "")
+
+    def test_data(self):
+        cases = [
+            ("data:,Hello%2C%20World!", "Hello, World!", "text/plain;charset=US-ASCII"),
+            ("data:text/html,<p>hi</p>", "<p>hi</p>", "text/html"),
+            ("data:text/html;charset=utf-8;base64,PHA+44GCPC9wPg==", "<p>あ</p>", "text/html;charset=utf-8"),
+        ]
+        for data_url, expected, content_type in cases:
+            with self.subTest(data_url=data_url):
+                headers, body = URL(data_url).request()
+                self.assertEqual(body, expected)
+                self.assertEqual(headers["content-type"], content_type)
+
+    def test_resolve_file(self):
+        url = URL("file:///srv/pages/index.html")
+        self.assertEqual(url.resolve("style.css"), "file:///srv/pages/style.css")
+
+
+class TestCharset(unittest.TestCase):
+    def test_detect_charset(self):
+        cases = [
+            ({"content-type": "text/html; charset=EUC-JP"}, b"", "euc_jp"),
+            ({"content-type": 'text/html; charset="utf-8"'}, b"", "utf-8"),
+            ({"content-type": "text/html"}, b'<meta charset="shift_jis">', "shift_jis"),
+            (
+                {},
+                b'<meta http-equiv="Content-Type" content="text/html; charset=iso-8859-1">',
+                "iso8859-1",
+            ),
+            # 不明な charset は無視する
+            ({"content-type": "text/html; charset=unknown"}, b"", "utf8"),
+            ({}, b"<html>", "utf8"),
+        ]
+        for headers, head, expected in cases:
+            with self.subTest(headers=headers, head=head):
+                self.assertEqual(detect_charset(headers, head), expected)
+
+
+class TestTLSSessionResumption(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not shutil.which("openssl"):
+            raise unittest.SkipTest("openssl is not available")
+        # localhost 用の自己署名証明書を作る
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.cert = os.path.join(cls.directory.name, "cert.pem")
+        cls.key = os.path.join(cls.directory.name, "key.pem")
+        subprocess.run(
+            [
+                "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                "-keyout", cls.key, "-out", cls.cert, "-subj", "/CN=localhost",
+                "-addext", "subjectAltName=DNS:localhost",
+            ],
+            check=True, capture_output=True,
+        )
+        cls.server = ThreadingHTTPServer(("localhost", 0), KeepAliveHandler)
+        cls.server.daemon_threads = True
+        server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_ctx.load_cert_chain(cls.cert, cls.key)
+        cls.server.socket = server_ctx.wrap_socket(cls.server.socket, server_side=True)
+        cls.port = cls.server.server_address[1]
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever)
+        cls.server_thread.daemon = True
+        cls.server_thread.start()
+
+        # 共有の SSLContext をテスト用の証明書を信頼するものに差し替える
+        cls.ssl_context = url_module._ssl_context
+        url_module._ssl_context = ssl.create_default_context(cafile=cls.cert)
+
+    @classmethod
+    def tearDownClass(cls):
+        url_module._ssl_context = cls.ssl_context
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.server_thread.join()
+        cls.directory.cleanup()
+
+    def test_resume_session(self):
+        tls_sessions = TLSSessionCache()
+        for i in range(3):
+            # プールを使い回さず、毎回新しい接続を張る
+            pool = ConnectionPool(tls_sessions=tls_sessions)
+            headers, body = URL("https://localhost:{}/{}".format(self.port, i)).request(pool=pool)
+            self.assertEqual(body, "path=/{}".format(i))
+            pool.clear()
+        self.assertEqual(tls_sessions.offered, 2)
+        self.assertEqual(tls_sessions.resumed, 2)
+
+    def test_shared_context(self):
+        self.assertIs(get_ssl_context(), get_ssl_context())
+
+
+class TestDNSCache(unittest.TestCase):
+    def test_resolve(self):
+        dns_cache = DNSCache()
+        first = dns_cache.resolve("localhost", 80)
+        self.assertIs(dns_cache.resolve("localhost", 80), first)
+        self.assertEqual((dns_cache.hits, dns_cache.misses), (1, 1))
+
+    def test_ttl(self):
+        dns_cache = DNSCache(ttl=0.05)
+        dns_cache.resolve("localhost", 80)
+        time.sleep(0.1)
+        dns_cache.resolve("localhost", 80)
+        self.assertEqual((dns_cache.hits, dns_cache.misses), (0, 2))
+
+    def test_resolve_async(self):
+        dns_cache = DNSCache()
+        asyncio.run(dns_cache.resolve_async("localhost", 80))
+        dns_cache.resolve("localhost", 80)
+        self.assertEqual((dns_cache.hits, dns_cache.misses), (1, 1))
+
+
+class TestContentDecoder(unittest.TestCase):
+    def test_decode_incrementally(self):
+        data = gzip.compress(LARGE_BODY.encode("utf8"))
+        decoder = ContentDecoder("gzip")
+        decoded = [decoder.decode(data[i:i + 1]) for i in range(len(data))]
+        # 全てのバイトが届く前に展開結果が得られる
+        self.assertTrue(any(decoded[:len(data) // 2]))
+        decoded.append(decoder.flush())
+        self.assertEqual(b"".join(decoded).decode("utf8"), LARGE_BODY)
+
+    def test_deflate_split_head(self):
+        # 最初のチャンクが 1 バイトでも zlib 形式と生の deflate を判別できる
+        body = LARGE_BODY.encode("utf8")
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw = compressor.compress(body) + compressor.flush()
+        for data in [zlib.compress(body), raw]:
+            decoder = ContentDecoder("deflate")
+            decoded = [decoder.decode(data[:1]), decoder.decode(b""), decoder.decode(data[1:])]
+            decoded.append(decoder.flush())
+            self.assertEqual(b"".join(decoded), body)
+        self.assertEqual(ContentDecoder("deflate").decode(b"x"), b"")
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(AssertionError):
+            ContentDecoder("br")
@@ -1,15 +1,659 @@
-from typing import Tuple
+from typing import Tuple, Dict, List, Optional, Iterator, AsyncIterator, BinaryIO, Generator
+import asyncio
+import base64
+import codecs
+import mimetypes
+import mmap
+import os
+import re
 import socket
 import ssl
+import threading
+import time
+import urllib.parse
+import zlib
+
+from http_cache import HTTPCache, CacheEntry
+
+# ボディを読み込む単位
+READ_SIZE = 64 * 1024
+
+# 取得の失敗で送出される例外。接続やファイルのエラー、不正な URL やレスポンス、
+# 途中で切れたボディ (EOFError)、壊れた圧縮データ (zlib.error)
+FETCH_ERRORS = (OSError, AssertionError, ValueError, EOFError, zlib.error)
+
+_ssl_context = None
+_ssl_context_lock = threading.Lock()
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    """全ての HTTPS 接続で共有する SSLContext。CA ストアの読み込みは初回の 1 度だけ行う"""
+    global _ssl_context
+    if _ssl_context is None:
+        with _ssl_context_lock:
+            if _ssl_context is None:
+                _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+class DNSCache:
+    def __init__(self, ttl: float = 60.0, family: int = socket.AF_INET) -> None:
+        """getaddrinfo の結果を ttl 秒の間キャッシュする。
+
+        Args:
+            ttl (float, optional): 名前解決の結果を再利用する秒数。 Defaults to 60.0.
+            family (int, optional): 解決するアドレスファミリ。 Defaults to socket.AF_INET.
+        """
+        self.ttl = ttl
+        self.family = family
+        self.entries: Dict[Tuple[str, int], Tuple[float, list]] = {}
+        self.lock = threading.Lock()
+
+        # 統計情報
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, host: str, port: int) -> Optional[list]:
+        with self.lock:
+            entry = self.entries.get((host, port))
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, host: str, port: int, addresses: list) -> None:
+        with self.lock:
+            self.entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+
+    def forget(self, host: str, port: int) -> None:
+        with self.lock:
+            self.entries.pop((host, port), None)
+
+    def resolve(self, host: str, port: int) -> list:
+        addresses = self.lookup(host, port)
+        if addresses is None:
+            addresses = socket.getaddrinfo(
+                host, port, self.family, socket.SOCK_STREAM, socket.IPPROTO_TCP
+            )
+            self.put(host, port, addresses)
+        return addresses
+
+    async def resolve_async(self, host: str, port: int) -> list:
+        addresses = self.lookup(host, port)
+        if addresses is None:
+            addresses = await asyncio.get_running_loop().getaddrinfo(
+                host, port, family=self.family, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
+            )
+            self.put(host, port, addresses)
+        return addresses
+
+
+class TLSSessionCache:
+    def __init__(self) -> None:
+        """(host, port) ごとに直近の TLS セッションを保持し、再接続時のハンドシェイクを再開させる"""
+        self.sessions: Dict[Tuple[str, int], ssl.SSLSession] = {}
+        self.lock = threading.Lock()
+
+        # 統計情報
+        self.offered = 0  # セッションを提示した接続の数
+        self.resumed = 0  # サーバーがセッションの再開を受け入れた接続の数
+
+    def get(self, host: str, port: int) -> Optional[ssl.SSLSession]:
+        with self.lock:
+            session = self.sessions.get((host, port))
+            if session:
+                self.offered += 1
+            return session
+
+    def save(self, host: str, port: int, sock: socket.socket) -> None:
+        """ハンドシェイク後 (TLS 1.3 では最初の読み込み後) にセッションを保存する"""
+        if not isinstance(sock, ssl.SSLSocket):
+            return
+        session = sock.session
+        if session is None or (not session.has_ticket and not session.id):
+            return
+        with self.lock:
+            self.sessions[(host, port)] = session
+
+    def handshaked(self, sock: ssl.SSLSocket) -> None:
+        if sock.session_reused:
+            with self.lock:
+                self.resumed += 1
+
+
+DEFAULT_DNS_CACHE = DNSCache()
+
+
+class Connection:
+    def __init__(self, key: Tuple[str, str, int], sock: socket.socket) -> None:
+        """ConnectionPool が管理する 1 本の持続的接続。
+
+        ヘッダー読み込み時に先読みしたバイトを失わないよう、
+        ソケットとそのバッファ付きファイルを接続の寿命の間ひとまとめに保持する。
+
+        Args:
+            key (Tuple[str, str, int]): (scheme, host, port)
+            sock (socket.socket): 接続済みのソケット
+        """
+        self.key = key
+        self.sock = sock
+        self.file = sock.makefile("rb")
+        self.last_used = time.monotonic()
+        self.reused = False  # プールから再利用された接続かどうか
+
+    def close(self) -> None:
+        self.file.close()
+        self.sock.close()
+
+
+class ConnectionPool:
+    def __init__(
+        self, max_per_host: int = 6, idle_timeout: float = 30.0,
+        dns_cache: Optional[DNSCache] = None, tls_sessions: Optional[TLSSessionCache] = None,
+    ) -> None:
+        """(scheme, host, port) ごとに HTTP/1.1 の持続的接続をプールする。
+
+        Args:
+            max_per_host (int, optional): ホストごとに同時に開いておける接続数の上限。 Defaults to 6.
+            idle_timeout (float, optional): アイドル接続を破棄するまでの秒数。 Defaults to 30.0.
+            dns_cache (Optional[DNSCache], optional): 名前解決のキャッシュ。 Defaults to DEFAULT_DNS_CACHE.
+            tls_sessions (Optional[TLSSessionCache], optional): TLS セッションのキャッシュ。
+        """
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.dns_cache = dns_cache or DEFAULT_DNS_CACHE
+        self.tls_sessions = tls_sessions or TLSSessionCache()
+        self.idle: Dict[Tuple[str, str, int], List[Connection]] = {}
+        self.opened: Dict[Tuple[str, str, int], int] = {}  # アイドル + 使用中の接続数
+        self.condition = threading.Condition()
+
+        # 統計情報
+        self.connects = 0
+        self.reuses = 0
+
+    def acquire(self, scheme: str, host: str, port: int) -> Connection:
+        """アイドル接続があれば再利用し、なければ新しく接続する。
+        ホストごとの上限に達している場合は接続が返却されるまで待つ。
+        """
+        key = (scheme, host, port)
+        with self.condition:
+            while True:
+                conn = self._pop_idle(key)
+                if conn:
+                    self.reuses += 1
+                    conn.reused = True
+                    return conn
+                if self.opened.get(key, 0) < self.max_per_host:
+                    self.opened[key] = self.opened.get(key, 0) + 1
+                    self.connects += 1
+                    break
+                self.condition.wait()
+
+        # 接続確立はロックの外で行う
+        try:
+            return Connection(key, self.connect(scheme, host, port))
+        except BaseException:
+            self._forget(key)
+            raise
+
+    def release(self, conn: Connection) -> None:
+        """レスポンスを読み切った接続をアイドル接続としてプールに戻す"""
+        conn.last_used = time.monotonic()
+        conn.reused = False
+        self.tls_sessions.save(conn.key[1], conn.key[2], conn.sock)
+        with self.condition:
+            self.idle.setdefault(conn.key, []).append(conn)
+            self.condition.notify()
+
+    def discard(self, conn: Connection) -> None:
+        """再利用できない接続を閉じる"""
+        self.tls_sessions.save(conn.key[1], conn.key[2], conn.sock)
+        conn.close()
+        self._forget(conn.key)
+
+    def clear(self) -> None:
+        """全てのアイドル接続を閉じる"""
+        with self.condition:
+            idle, self.idle = self.idle, {}
+            for key, conns in idle.items():
+                self.opened[key] -= len(conns)
+            self.condition.notify_all()
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def connect(self, scheme: str, host: str, port: int) -> socket.socket:
+        # 名前解決の結果を順に試す
+        error = None
+        for family, type, proto, _, address in self.dns_cache.resolve(host, port):
+            s = socket.socket(family=family, type=type, proto=proto)
+            try:
+                # HTTPS の場合ソケットを SSL でラップし、以前のセッションがあれば再開を試みる
+                if scheme == "https":
+                    s = get_ssl_context().wrap_socket(
+                        s, server_hostname=host, session=self.tls_sessions.get(host, port)
+                    )
+                s.connect(address)
+            except OSError as e:
+                s.close()
+                error = e
+                continue
+            if scheme == "https":
+                self.tls_sessions.handshaked(s)
+            return s
+        # キャッシュしたアドレスが古くなっている可能性があるので解決し直させる
+        self.dns_cache.forget(host, port)
+        raise error
+
+    def _pop_idle(self, key: Tuple[str, str, int]) -> Optional[Connection]:
+        # 新しいものから取り出し、アイドル時間を超えた接続は閉じる
+        conns = self.idle.get(key, [])
+        now = time.monotonic()
+        while conns:
+            conn = conns.pop()
+            if now - conn.last_used < self.idle_timeout:
+                return conn
+            conn.close()
+            self.opened[key] -= 1
+        return None
+
+    def _forget(self, key: Tuple[str, str, int]) -> None:
+        with self.condition:
+            self.opened[key] -= 1
+            self.condition.notify()
+
+
+DEFAULT_POOL = ConnectionPool()
+
+
+class ContentDecoder:
+    def __init__(self, content_encoding: str = "identity") -> None:
+        """Content-Encoding を届いたバイト列から順に展開する。
+
+        Args:
+            content_encoding (str, optional): Content-Encoding ヘッダーの値。 Defaults to "identity".
+        """
+        # 複数指定されている場合は適用された順と逆順に展開する
+        encodings = [
+            e.strip().lower() for e in content_encoding.split(",") if e.strip()
+        ]
+        for encoding in encodings:
+            assert encoding in ["gzip", "x-gzip", "deflate", "identity"], \
+                "Unknown content-encoding {}".format(encoding)
+        self.encodings = [e for e in reversed(encodings) if e != "identity"]
+        self.decompressors = [None] * len(self.encodings)
+        # 展開器を選ぶ前に届いた先頭のバイト列
+        self.heads = [b""] * len(self.encodings)
+
+    def decode(self, data: bytes) -> bytes:
+        for i, encoding in enumerate(self.encodings):
+            if not data:
+                break
+            if self.decompressors[i] is None:
+                data = self.heads[i] + data
+                # deflate の形式は先頭 2 バイトで判別するので、揃うまで溜めておく
+                if encoding == "deflate" and len(data) < 2:
+                    self.heads[i] = data
+                    return b""
+                self.heads[i] = b""
+                self.decompressors[i] = self.decompressor(encoding, data)
+            data = self.decompressors[i].decompress(data)
+        return data
+
+    def flush(self) -> bytes:
+        """展開器に残っているバイト列を全て掃き出す"""
+        data = b""
+        for i, encoding in enumerate(self.encodings):
+            if self.decompressors[i] is None:
+                data, self.heads[i] = self.heads[i] + data, b""
+                if not data:
+                    continue
+                self.decompressors[i] = self.decompressor(encoding, data)
+            data = self.decompressors[i].decompress(data) + self.decompressors[i].flush()
+        return data
+
+    @staticmethod
+    def decompressor(encoding: str, head: bytes):
+        if encoding in ["gzip", "x-gzip"]:
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # deflate は zlib 形式が正しいが、生の deflate を送るサーバーも多いので先頭 2 バイトで判別
+        if len(head) >= 2 and head[0] & 0x0F == 8 and (head[0] << 8 | head[1]) % 31 == 0:
+            return zlib.decompressobj(zlib.MAX_WBITS)
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+
+
+def build_request(host: str, path: str, request_headers: Optional[dict] = None) -> bytes:
+    """GET リクエストのバイト列を組み立てる"""
+    request = "GET {} HTTP/1.1\r\n".format(path)
+    request += "Host: {}\r\n".format(host)
+    request += "Accept-Encoding: gzip, deflate\r\n"
+    request += "Connection: keep-alive\r\n"
+    for header, value in (request_headers or {}).items():
+        request += "{}: {}\r\n".format(header, value)
+    return (request + "\r\n").encode("utf8")
+
+
+def parse_response_head(lines: List[bytes]) -> Tuple[str, str, dict, bool]:
+    """ステータス行とヘッダー行をパースする。同期・非同期の両方の読み込みで共有する。
+
+    Args:
+        lines (List[bytes]): ステータス行から空行の手前までの行
+
+    Returns:
+        Tuple[str, str, dict, bool]: バージョン、ステータス、ヘッダー、接続を再利用できるかどうか
+    """
+    if not lines or not lines[0]:
+        raise EOFError("Connection closed before response")
+    version, status, explanation = lines[0].decode("utf8").split(" ", 2)
+
+    headers = {}
+    for line in lines[1:]:
+        header, value = line.decode("utf8").split(":", 1)
+        headers[header.lower()] = value.strip()
+
+    # HTTP/1.1 はデフォルトで持続的接続、HTTP/1.0 は明示された場合のみ
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.1":
+        keep_alive = connection != "close"
+    else:
+        keep_alive = connection == "keep-alive"
+    return version, status, headers, keep_alive
+
+
+def body_framing(status: str, headers: dict) -> str:
+    """ボディの終わりの判定方法を返す
+
+    Returns:
+        str: "none"、"chunked"、"length"、"close" のいずれか
+    """
+    transfer_encoding = headers.get("transfer-encoding", "identity").lower()
+    if status in ["204", "304"] or status.startswith("1"):
+        # ボディを持たないレスポンス
+        return "none"
+    elif transfer_encoding == "chunked":
+        return "chunked"
+    elif "content-length" in headers:
+        return "length"
+    # Content-Length がなければ接続が閉じられるまでがボディ
+    assert transfer_encoding == "identity", \
+        "Unknown transfer-encoding {}".format(transfer_encoding)
+    return "close"
+
+
+def is_header_end(line: bytes) -> bool:
+    return line in (b"\r\n", b"\n", b"")
+
+
+def iter_content_length(response: BinaryIO, length: int) -> Iterator[bytes]:
+    """Content-Length 分のボディを READ_SIZE ずつ読み込む"""
+    while length > 0:
+        data = response.read1(min(length, READ_SIZE))
+        if not data:
+            raise EOFError("Connection closed before end of body")
+        length -= len(data)
+        yield data
+
+
+def iter_chunked(response: BinaryIO) -> Iterator[bytes]:
+    """Transfer-Encoding: chunked のボディをチャンクが届くたびに読み込む"""
+    while True:
+        line = response.readline()
+        if not line:
+            raise EOFError("Connection closed before end of body")
+        # チャンク拡張 (;name=value) は無視する
+        size = int(line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            break
+        yield from iter_content_length(response, size)
+        response.readline()  # チャンク末尾の CRLF
+
+    # トレイラーは読み飛ばす
+    while not is_header_end(response.readline()):
+        pass
+
+
+def iter_until_close(response: BinaryIO) -> Iterator[bytes]:
+    """接続が閉じられるまでをボディとして読み込む"""
+    while True:
+        data = response.read1(READ_SIZE)
+        if not data:
+            break
+        yield data
+
+
+async def aiter_content_length(reader: asyncio.StreamReader, length: int) -> AsyncIterator[bytes]:
+    """iter_content_length の asyncio 版"""
+    while length > 0:
+        data = await reader.read(min(length, READ_SIZE))
+        if not data:
+            raise EOFError("Connection closed before end of body")
+        length -= len(data)
+        yield data
+
+
+async def aiter_chunked(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    """iter_chunked の asyncio 版"""
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise EOFError("Connection closed before end of body")
+        size = int(line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            break
+        async for data in aiter_content_length(reader, size):
+            yield data
+        await reader.readline()
+
+    while not is_header_end(await reader.readline()):
+        pass
+
+
+async def aiter_until_close(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    """iter_until_close の asyncio 版"""
+    while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+            break
+        yield data
+
+
+# <meta charset="..."> または <meta http-equiv="Content-Type" content="...; charset=..."> を探す
+META_CHARSET = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+# charset を探すボディ先頭のバイト数
+SNIFF_SIZE = 1024
+
+
+def detect_charset(headers: dict, head: bytes = b"") -> str:
+    """Content-Type の charset、ボディ先頭の <meta charset> の順に文字コードを決める。
+
+    Args:
+        headers (dict): レスポンスヘッダー
+        head (bytes, optional): ボディの先頭部分。 Defaults to b"".
+
+    Returns:
+        str: Python のコーデック名。判別できなければ "utf8"
+    """
+    charset = header_charset(headers)
+    if charset:
+        return charset
+    match = META_CHARSET.search(head[:SNIFF_SIZE])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+    return "utf8"
+
+
+def header_charset(headers: dict) -> Optional[str]:
+    """Content-Type の charset を Python のコーデック名にして返す。指定がないか不明なら None"""
+    for param in headers.get("content-type", "").split(";")[1:]:
+        if "=" in param:
+            name, value = param.split("=", 1)
+            if name.strip().lower() == "charset":
+                try:
+                    return codecs.lookup(value.strip().strip("\"'")).name
+                except LookupError:
+                    continue
+    return None
+
+
+def decode_body(headers: dict, body: bytes) -> str:
+    """ボディ全体を 1 回でデコードする"""
+    return str(body, detect_charset(headers, body[:SNIFF_SIZE]), "replace")
+
+
+class Response:
+    def __init__(
+        self, pool: ConnectionPool, conn: Connection, status: str, headers: dict, keep_alive: bool
+    ) -> None:
+        """ヘッダーまで読み込んだレスポンス。ボディは read か iter_bytes で読み込む。
+
+        ボディを読み切れば接続をプールに戻し、途中で止めれば閉じる。
+        """
+        self.pool = pool
+        self.conn = conn
+        self.status = status
+        self.headers = headers
+        self.keep_alive = keep_alive
+        self.framing = body_framing(status, headers)
+        self.content_encoding = headers.get("content-encoding", "identity")
+        self.finished = False
+
+    def read(self) -> bytes:
+        """ボディ全体を展開して返す。
+
+        内容符号化のない Content-Length 付きのボディは、その長さで確保したバッファに
+        バイナリのまま読み込む。バッファ付きリーダーに残っている分を除けば、
+        readinto はソケットの recv_into で直接バッファに書き込む。
+        """
+        if self.framing != "length" or self.content_encoding.strip().lower() != "identity":
+            return b"".join(self.iter_bytes())
+
+        done = False
+        try:
+            length = int(self.headers["content-length"])
+            buffer = bytearray(length)
+            view = memoryview(buffer)
+            pos = 0
+            while pos < length:
+                n = self.conn.file.readinto(view[pos:])
+                if not n:
+                    raise EOFError("Connection closed before end of body")
+                pos += n
+            done = True
+        finally:
+            self.finish(done)
+        return buffer
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """ボディを届いた分ずつ展開して返す"""
+        done = False
+        try:
+            # 転送符号化と内容符号化を、届いたチャンクから順に展開する
+            if self.framing == "none":
+                chunks = iter([])
+            elif self.framing == "chunked":
+                chunks = iter_chunked(self.conn.file)
+            elif self.framing == "length":
+                chunks = iter_content_length(self.conn.file, int(self.headers["content-length"]))
+            else:
+                chunks = iter_until_close(self.conn.file)
+
+            decoder = ContentDecoder(self.content_encoding)
+            for chunk in chunks:
+                data = decoder.decode(chunk)
+                if data:
+                    yield data
+            data = decoder.flush()
+            if data:
+                yield data
+            done = True
+        finally:
+            self.finish(done)
+
+    def finish(self, done: bool) -> None:
+        """接続を手放す。2 回目以降の呼び出しは何もしない"""
+        if self.finished:
+            return
+        self.finished = True
+        if done and self.keep_alive and self.framing != "close":
+            self.pool.release(self.conn)
+        else:
+            self.pool.discard(self.conn)
+
+
+class BodyStream:
+    def __init__(self, chunks: Iterator[str], response: Response) -> None:
+        """stream が返すボディのイテレータ。
+
+        ジェネレータの finally は読み始めるまで実行されないので、一度も next を
+        呼ばずに捨てられた場合も close か __del__ で接続を手放す。
+        """
+        self.chunks = chunks
+        self.response = response
+
+    def __iter__(self) -> "BodyStream":
+        return self
+
+    def __next__(self) -> str:
+        return next(self.chunks)
+
+    def close(self) -> None:
+        self.chunks.close()
+        self.response.finish(False)
+
+    def __del__(self) -> None:
+        self.close()
+
+
+# リダイレクトを表すステータスと、恒久的なリダイレクトのステータス
+REDIRECT_STATUSES = ["301", "302", "303", "307", "308"]
+PERMANENT_REDIRECT_STATUSES = ["301", "308"]
+# 辿るリダイレクトの最大数
+MAX_REDIRECTS = 10
+
+
+class RedirectCache:
+    def __init__(self) -> None:
+        """301/308 のリダイレクト先を覚えておき、以降は往復せずに最終的な URL へ直接リクエストする"""
+        self.permanent: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+        # 統計情報
+        self.hits = 0  # 省略できたリダイレクトの回数
+
+    def add(self, source: str, target: str) -> None:
+        with self.lock:
+            self.permanent[source] = target
+
+    def lookup(self, url: str) -> str:
+        """恒久的なリダイレクトを辿った先の URL を返す"""
+        with self.lock:
+            seen = {url}
+            while url in self.permanent:
+                url = self.permanent[url]
+                self.hits += 1
+                # リダイレクトがループしていたらそこで止める
+                if url in seen:
+                    break
+                seen.add(url)
+        return url
+
+
+DEFAULT_REDIRECTS = RedirectCache()
 
 
 class URL:
     def __init__(self, url: str) -> None:
         self.url = url
+        # リダイレクトを辿った後の URL。request などの後に設定される
+        self.final_url = url
 
     def parse_url(self) -> Tuple[str, str, str, int]:
         scheme, url = self.url.split("://", 1)
-        assert scheme in ["http", "https"], "Unknown scheme {}".format(scheme)
+        assert scheme in ["http", "https", "file"], "Unknown scheme {}".format(scheme)
 
         if "/" not in url:
             url = url + "/"
@@ -24,52 +668,393 @@ class URL:
 
         return (scheme, host, "/" + path, port)
 
-    def request(self) -> Tuple[dict, str]:
+    def is_local(self) -> bool:
+        """ソケットを使わずに読み込む file: と data: の URL かどうか"""
+        return self.url.startswith(("file://", "data:"))
+
+    def load_local(self) -> Tuple[dict, str]:
+        """file: はファイルを mmap して、data: は URL 自体からボディを読み込む"""
+        if self.url.startswith("data:"):
+            return self.load_data()
+
         scheme, host, path, port = self.parse_url()
+        path = urllib.parse.unquote(path.split("?", 1)[0].split("#", 1)[0])
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            headers = {
+                "content-type": mimetypes.guess_type(path)[0] or "application/octet-stream",
+                "content-length": str(size),
+            }
+            # 空のファイルは mmap できない
+            if size == 0:
+                return headers, ""
+            # ページキャッシュをそのままデコードし、中間の bytes を作らない
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return headers, decode_body(headers, mapped)
 
-        s = socket.socket(
-            family=socket.AF_INET,
-            type=socket.SOCK_STREAM,
-            proto=socket.IPPROTO_TCP,
-        )
-        # HTTPS の場合ソケットを SSL でラップ
-        if scheme == "https":
-            ctx = ssl.create_default_context()
-            s = ctx.wrap_socket(s, server_hostname=host)
+    def load_data(self) -> Tuple[dict, str]:
+        """data:[<mediatype>][;base64],<data> をデコードする"""
+        assert "," in self.url, "Malformed data URL"
+        meta, data = self.url[len("data:"):].split(",", 1)
+        params = meta.split(";")
+        if params[-1].strip().lower() == "base64":
+            params.pop()
+            body = base64.b64decode(urllib.parse.unquote_to_bytes(data))
+        else:
+            body = urllib.parse.unquote_to_bytes(data)
+        headers = {
+            "content-type": ";".join(params) or "text/plain;charset=US-ASCII",
+            "content-length": str(len(body)),
+        }
+        return headers, decode_body(headers, body)
+
+    def port(self) -> int:
+        scheme, host, path, port = self.parse_url()
+        if port:
+            return port
+        return 443 if scheme == "https" else 80
+
+    def resolve(self, href: str) -> str:
+        """この URL を基準に相対 URL を絶対 URL にする。
 
-        # ポートを指定
+        Args:
+            href (str): Location ヘッダーや href 属性の値
+        """
+        if "://" in href:
+            return href
+        scheme, host, path, port = self.parse_url()
         if port:
-            pass
-        elif scheme == "http":
-            port = 80
-        elif scheme == "https":
-            port = 443
+            host = "{}:{}".format(host, port)
+        if href.startswith("//"):
+            return scheme + ":" + href
+        if href.startswith("/"):
+            path = href
+        else:
+            # 同じディレクトリからの相対パス
+            directory = path.split("?", 1)[0].rsplit("/", 1)[0]
+            path = directory + "/" + href
 
-        s.connect((host, port))
+        # . と .. を正規化する
+        path, query = (path.split("?", 1) + [None])[:2]
+        parts = []
+        for part in path.split("/")[1:]:
+            if part == "..":
+                if parts:
+                    parts.pop()
+            elif part != ".":
+                parts.append(part)
+        if path.endswith(("/.", "/..")):
+            parts.append("")
+        path = "/" + "/".join(parts)
+        if query is not None:
+            path += "?" + query
+        return "{}://{}{}".format(scheme, host, path)
 
-        s.send(
-            "GET {} HTTP/1.0\r\n".format(path).encode("utf8")
-            + "Host: {}\r\n\r\n".format(host).encode("utf8")
-        )
+    def redirect_target(self, status: str, headers: dict, redirects: RedirectCache) -> Optional[str]:
+        """リダイレクトであれば移動先の URL を返し、恒久的なものは覚えておく"""
+        if status not in REDIRECT_STATUSES or "location" not in headers:
+            return None
+        target = self.resolve(headers["location"])
+        if status in PERMANENT_REDIRECT_STATUSES:
+            redirects.add(self.url, target)
+        return target
 
-        # read bits of response have already arrived
-        response = s.makefile("r", encoding="utf8", newline="\r\n")
+    def request(
+        self, pool: Optional[ConnectionPool] = None, cache: Optional[HTTPCache] = None,
+        redirects: Optional[RedirectCache] = None, max_redirects: int = MAX_REDIRECTS,
+    ) -> Tuple[dict, str]:
+        """URL のリソースを取得する。
+
+        Args:
+            pool (Optional[ConnectionPool], optional): 使用する接続プール。 Defaults to DEFAULT_POOL.
+            cache (Optional[HTTPCache], optional): HTTP キャッシュ。None の場合はキャッシュしない。
+            redirects (Optional[RedirectCache], optional): 恒久的なリダイレクトの記録。 Defaults to DEFAULT_REDIRECTS.
+            max_redirects (int, optional): 辿るリダイレクトの最大数。 Defaults to MAX_REDIRECTS.
+
+        Returns:
+            Tuple[dict, str]: レスポンスヘッダーとボディ
+        """
+        if self.is_local():
+            return self.load_local()
+        url, entry, opened = self.follow(pool, cache, redirects, max_redirects)
+        if opened is None:
+            return entry.headers, decode_body(entry.headers, entry.body)
+        status, headers, response = opened
+        return url.complete(cache, entry, status, headers, response.read())
+
+    def stream(
+        self, pool: Optional[ConnectionPool] = None, cache: Optional[HTTPCache] = None,
+        redirects: Optional[RedirectCache] = None, max_redirects: int = MAX_REDIRECTS,
+    ) -> Tuple[dict, Iterator[str]]:
+        """ヘッダーを読んだ時点で返り、ボディはソケットから届いた分ずつ文字列で返すイテレータとする。
+        最後のバイトを待たずにパースを始められる。接続はイテレータを読み切った時点でプールに戻る。
+
+        Args:
+            pool (Optional[ConnectionPool], optional): 使用する接続プール。 Defaults to DEFAULT_POOL.
+            cache (Optional[HTTPCache], optional): HTTP キャッシュ。None の場合はキャッシュしない。
+            redirects (Optional[RedirectCache], optional): 恒久的なリダイレクトの記録。 Defaults to DEFAULT_REDIRECTS.
+            max_redirects (int, optional): 辿るリダイレクトの最大数。 Defaults to MAX_REDIRECTS.
+
+        Returns:
+            Tuple[dict, Iterator[str]]: レスポンスヘッダーとボディのチャンクのイテレータ
+        """
+        if self.is_local():
+            headers, body = self.load_local()
+            return headers, iter([body])
+        url, entry, opened = self.follow(pool, cache, redirects, max_redirects)
+        if opened is None:
+            return entry.headers, iter([decode_body(entry.headers, entry.body)])
+        status, headers, response = opened
+        if status != "200":
+            headers, body = url.complete(cache, entry, status, headers, response.read())
+            return headers, iter([body])
+        return headers, BodyStream(url.iter_text(response.iter_bytes(), headers, cache), response)
+
+    def follow(
+        self, pool: Optional[ConnectionPool], cache: Optional[HTTPCache],
+        redirects: Optional[RedirectCache], max_redirects: int,
+    ) -> Tuple["URL", Optional[CacheEntry], Optional[Tuple[str, dict, Response]]]:
+        """リダイレクトを辿り、最終的な URL のレスポンスをヘッダーまで開く。
+
+        Returns:
+            Tuple[URL, Optional[CacheEntry], Optional[Tuple[str, dict, Response]]]:
+                最終的な URL、そのキャッシュエントリ、open の戻り値。
+                新鮮なキャッシュエントリがあれば open の戻り値は None
+        """
+        hops = self.hops(cache, redirects, max_redirects)
+        url, entry, request_headers = next(hops)
+        while request_headers is not None:
+            status, headers, response = url.open(pool, request_headers)
+            try:
+                next_hop = hops.send((status, headers))
+            except StopIteration:
+                return url, entry, (status, headers, response)
+            except BaseException:
+                response.finish(False)
+                raise
+            response.read()  # 接続を再利用するためにボディを読み捨てる
+            url, entry, request_headers = next_hop
+        return url, entry, None
+
+    def hops(
+        self, cache: Optional[HTTPCache], redirects: Optional[RedirectCache], max_redirects: int,
+    ) -> Generator[Tuple["URL", Optional[CacheEntry], Optional[dict]], Tuple[str, dict], None]:
+        """リダイレクトとキャッシュの判断を行い、通信は呼び出し側に任せるジェネレータ。
+        follow と request_async が共有する。
+
+        リクエストする URL、そのキャッシュエントリ、リクエストヘッダーを yield する。
+        リクエストヘッダーが None なら新鮮なキャッシュエントリがあり、通信は要らない。
+        そうでなければ呼び出し側がリクエストし、レスポンスのステータスとヘッダーを send する。
+        リダイレクトでなければジェネレータは終わる。
+        """
+        redirects = redirects or DEFAULT_REDIRECTS
+        url = URL(redirects.lookup(self.url))
+        for hop in range(max_redirects + 1):
+            self.final_url = url.url
+            entry, fresh = cache.lookup_fresh(url.url) if cache else (None, False)
+            if fresh:
+                yield url, entry, None
+                return
+
+            # 古くなったエントリは条件付きリクエストで再検証する
+            status, headers = yield url, entry, entry.validators() if entry else {}
+            target = url.redirect_target(status, headers, redirects)
+            if target is None:
+                return
+            url = URL(target)
+        assert False, "Too many redirects: {}".format(self.url)
+
+    def iter_text(self, chunks: Iterator[bytes], headers: dict,
+                  cache: Optional[HTTPCache] = None) -> Iterator[str]:
+        """展開済みのバイト列を文字列に逐次デコードし、読み切ったらキャッシュに保存する"""
+        charset = header_charset(headers)
+        decoder = codecs.getincrementaldecoder(charset)("replace") if charset else None
+        # Content-Type に charset がなければ、<meta charset> を探せるだけ溜めてから文字コードを決める
+        head: List[bytes] = []
+        head_size = 0
+        body = [] if cache else None
+        try:
+            for chunk in chunks:
+                if body is not None:
+                    body.append(chunk)
+                if decoder is None:
+                    head.append(chunk)
+                    head_size += len(chunk)
+                    if head_size < SNIFF_SIZE:
+                        continue
+                    chunk = b"".join(head)
+                    decoder = codecs.getincrementaldecoder(detect_charset(headers, chunk))("replace")
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        finally:
+            # 途中で止められた場合も接続を確実に手放す
+            chunks.close()
+        if decoder is None:
+            # SNIFF_SIZE に満たない短いボディ
+            chunk = b"".join(head)
+            decoder = codecs.getincrementaldecoder(detect_charset(headers, chunk))("replace")
+        else:
+            chunk = b""
+        text = decoder.decode(chunk, final=True)
+        if text:
+            yield text
+        if cache:
+            cache.store(self.url, headers, b"".join(body))
 
-        statusline = response.readline()
-        version, status, explanation = statusline.split(" ", 2)
-        assert status == "200", "{}: {}".format(status, explanation)
+    async def request_async(
+        self, cache: Optional[HTTPCache] = None,
+        redirects: Optional[RedirectCache] = None, max_redirects: int = MAX_REDIRECTS,
+    ) -> Tuple[dict, str]:
+        """request の asyncio 版。ヘッダーのパースとボディの展開は request と共有する。"""
+        if self.is_local():
+            return self.load_local()
+        hops = self.hops(cache, redirects, max_redirects)
+        url, entry, request_headers = next(hops)
+        while request_headers is not None:
+            status, headers, body = await url.fetch_async(request_headers)
+            try:
+                next_hop = hops.send((status, headers))
+            except StopIteration:
+                return url.complete(cache, entry, status, headers, body)
+            url, entry, request_headers = next_hop
+        return entry.headers, decode_body(entry.headers, entry.body)
 
-        headers = {}
-        while True:
+    def complete(self, cache, entry, status: str, headers: dict, body: bytes) -> Tuple[dict, str]:
+        """レスポンスをキャッシュに反映し、request の戻り値を作る"""
+        if cache and entry and status == "304":
+            entry = cache.update(entry, headers)
+            return entry.headers, decode_body(entry.headers, entry.body)
+
+        assert status == "200", "{}: {}".format(status, self.url)
+        if cache:
+            cache.store(self.url, headers, body)
+        return headers, decode_body(headers, body)
+
+    def fetch(
+        self, pool: Optional[ConnectionPool] = None, request_headers: Optional[dict] = None
+    ) -> Tuple[str, dict, bytes]:
+        """プールした接続でリクエストを送り、ステータス、ヘッダー、展開済みのボディを返す"""
+        status, headers, response = self.open(pool, request_headers)
+        return status, headers, response.read()
+
+    def open(
+        self, pool: Optional[ConnectionPool] = None, request_headers: Optional[dict] = None
+    ) -> Tuple[str, dict, Response]:
+        """プールした接続でリクエストを送り、ヘッダーまでを読み込む。
+
+        Returns:
+            Tuple[str, dict, Response]: ステータス、ヘッダー、ボディを読み込むための Response
+        """
+        scheme, host, path, _ = self.parse_url()
+        port = self.port()
+        pool = pool or DEFAULT_POOL
+
+        conn = pool.acquire(scheme, host, port)
+        try:
+            try:
+                status, headers, keep_alive = self.send(conn, host, path, request_headers)
+            except (ConnectionError, EOFError):
+                # プールしていた接続がサーバー側で閉じられていた場合、新しい接続で一度だけやり直す
+                if not conn.reused:
+                    raise
+                pool.discard(conn)
+                # 接続に失敗した場合は acquire が数を戻すので、二重に捨てないようにする
+                conn = None
+                conn = pool.acquire(scheme, host, port)
+                status, headers, keep_alive = self.send(conn, host, path, request_headers)
+        except BaseException:
+            if conn is not None:
+                pool.discard(conn)
+            raise
+        return status, headers, Response(pool, conn, status, headers, keep_alive)
+
+    def send(
+        self, conn: Connection, host: str, path: str, request_headers: Optional[dict] = None
+    ) -> Tuple[str, dict, bool]:
+        """接続上でリクエストを送り、レスポンスのヘッダーまでを読み込む。
+
+        Returns:
+            Tuple[str, dict, bool]: ステータス、ヘッダー、接続を再利用できるかどうか
+        """
+        conn.sock.sendall(build_request(host, path, request_headers))
+
+        # read bits of response have already arrived
+        response = conn.file
+
+        lines = [response.readline()]
+        while lines[0]:
             line = response.readline()
-            if line == "\r\n":
+            if is_header_end(line):
                 break
-            header, value = line.split(":", 1)
-            headers[header.lower()] = value.strip()
+            lines.append(line)
+        version, status, headers, keep_alive = parse_response_head(lines)
+        return status, headers, keep_alive
+
+    async def fetch_async(self, request_headers: Optional[dict] = None) -> Tuple[str, dict, bytes]:
+        """fetch の asyncio 版。リクエストごとに asyncio のストリームで接続する。"""
+        scheme, host, path, _ = self.parse_url()
+        port = self.port()
+        ctx = get_ssl_context() if scheme == "https" else None
+        # 名前解決はキャッシュした結果を使い、アドレスに直接接続する
+        address = (await DEFAULT_DNS_CACHE.resolve_async(host, port))[0][4]
+        reader, writer = await asyncio.open_connection(
+            address[0], address[1], ssl=ctx, server_hostname=host if ctx else None
+        )
+        try:
+            writer.write(build_request(host, path, request_headers))
+            await writer.drain()
+
+            lines = [await reader.readline()]
+            while lines[0]:
+                line = await reader.readline()
+                if is_header_end(line):
+                    break
+                lines.append(line)
+            version, status, headers, keep_alive = parse_response_head(lines)
+
+            framing = body_framing(status, headers)
+            if framing == "none":
+                chunks = None
+            elif framing == "chunked":
+                chunks = aiter_chunked(reader)
+            elif framing == "length":
+                chunks = aiter_content_length(reader, int(headers["content-length"]))
+            else:
+                chunks = aiter_until_close(reader)
+
+            decoder = ContentDecoder(headers.get("content-encoding", "identity"))
+            body = []
+            if chunks:
+                async for chunk in chunks:
+                    body.append(decoder.decode(chunk))
+            body.append(decoder.flush())
+            return status, headers, b"".join(body)
+        finally:
+            writer.close()
+
+
+async def fetch_many(
+    urls: List[str], concurrency: int = 6, cache: Optional[HTTPCache] = None,
+    return_exceptions: bool = False,
+) -> List[Tuple[dict, str]]:
+    """複数の URL を最大 concurrency 件ずつ並行して取得する。
+
+    Args:
+        urls (List[str]): 取得する URL のリスト
+        concurrency (int, optional): 同時に取得する最大数。 Defaults to 6.
+        cache (Optional[HTTPCache], optional): HTTP キャッシュ。 Defaults to None.
+        return_exceptions (bool, optional): True の場合、失敗した URL の例外を結果に含める。 Defaults to False.
+
+    Returns:
+        List[Tuple[dict, str]]: urls と同じ順のヘッダーとボディ
+    """
+    semaphore = asyncio.Semaphore(concurrency)
 
-        assert "transfer-encoding" not in headers
-        assert "content-encoding" not in headers
+    async def fetch(url: str) -> Tuple[dict, str]:
+        async with semaphore:
+            return await URL(url).request_async(cache=cache)
 
-        body = response.read()
-        s.close()
-        return headers, body
+    return await asyncio.gather(
+        *[fetch(url) for url in urls], return_exceptions=return_exceptions
+    )